@@ -0,0 +1,64 @@
+import hashlib
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, func, select, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.schema import CreateTable
+
+from app.db.base import Base
+
+
+# Tabla fuera de Base.metadata para que no altere la huella del esquema.
+_version_metadata = MetaData()
+schema_version = Table(
+    "schema_version",
+    _version_metadata,
+    Column("id", Integer, primary_key=True),
+    Column("version", String(64), nullable=False),
+    Column("applied_at", DateTime(timezone=True), nullable=False, server_default=func.now()),
+)
+
+
+def schema_fingerprint(engine: AsyncEngine) -> str:
+    """Huella del DDL de los modelos registrados en ``Base.metadata``.
+
+    Incluye el DDL adicional declarado en ``table.info["ddl"]`` (triggers, funciones).
+    """
+    digest = hashlib.sha256()
+    for table in Base.metadata.sorted_tables:
+        digest.update(str(CreateTable(table).compile(dialect=engine.dialect)).encode("utf-8"))
+        for statement in table.info.get("ddl", ()):
+            digest.update(statement.encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+async def ensure_schema(engine: AsyncEngine, *, mode: str = "auto") -> bool:
+    """Crea tablas según ``mode`` y devuelve ``True`` si se ejecutó DDL.
+
+    - ``auto``: ejecuta ``create_all`` solo si la huella guardada no coincide.
+    - ``create``: ejecuta siempre ``create_all`` (comportamiento anterior).
+    - ``skip``: no toca el esquema (lo gestionan las migraciones).
+    """
+    if mode == "skip":
+        return False
+
+    version = schema_fingerprint(engine)
+    if mode == "auto":
+        try:
+            async with engine.connect() as conn:
+                current = (await conn.execute(select(schema_version.c.version).where(schema_version.c.id == 1))).scalar()
+        except DBAPIError:
+            current = None
+        if current == version:
+            return False
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        if engine.dialect.name == "postgresql":
+            for table in Base.metadata.sorted_tables:
+                for statement in table.info.get("ddl", ()):
+                    await conn.execute(text(statement))
+        await conn.run_sync(_version_metadata.create_all)
+        await conn.execute(schema_version.delete())
+        await conn.execute(schema_version.insert().values(id=1, version=version))
+    return True
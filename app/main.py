@@ -1,13 +1,17 @@
+import asyncio
 import logging
 
-from fastapi import FastAPI
+from fastapi import FastAPI, status
+from fastapi.responses import JSONResponse
+from sqlalchemy import text
 
 from app.core.config import settings
-from app.db.base import Base
+from app.db.schema import ensure_schema
 from app.db.session import engine, init_models
 from app.routers.routes import router as api_router
 from app.modules.mqtt.manager import get_mqtt_manager
 from app.modules.mqtt.ingest import handle_message as mqtt_handle_message
+from app.modules.sensors.registry import get_sensor_registry
 
 
 app = FastAPI(title=settings.APP_NAME, version="0.1.0", debug=settings.DEBUG)
@@ -25,34 +29,74 @@ def health():
     return {"status": "ok"}
 
 
+# Estado de arranque en segundo plano, consultado por /ready.
+_startup = {"database": "pending", "task": None, "registry": None}
+
+
+@app.get("/ready", tags=["health"])
+async def ready():
+    """Readiness: BD inicializada y accesible; informa además el estado MQTT."""
+    body = {"database": _startup["database"], "mqtt": get_mqtt_manager().stats()["state"]}
+    if _startup["database"] == "ready":
+        try:
+            # El timeout cubre también la conexión: un host inalcanzable no debe colgar /ready.
+            await asyncio.wait_for(_ping_database(), timeout=settings.READY_DB_TIMEOUT)
+        except Exception as exc:  # noqa: BLE001
+            body["database"] = f"unreachable: {exc.__class__.__name__}"
+        else:
+            return {"status": "ready", **body}
+    return JSONResponse({"status": "not ready", **body}, status_code=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+
+async def _ping_database() -> None:
+    async with engine.connect() as conn:
+        await conn.execute(text("SELECT 1"))
+
+
 app.include_router(api_router, prefix=settings.API_PREFIX)
 
 
 @app.on_event("startup")
 async def on_startup() -> None:
-    """Inicializa metadata y crea tablas en ausencia de migraciones."""
+    """Arranca BD y MQTT en segundo plano para que el servidor HTTP acepte tráfico de inmediato."""
 
     init_models()
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
-
-    try:
-        manager = get_mqtt_manager()
-        manager.register_message_handler(mqtt_handle_message)
-        await manager.connect()
-        # Suscribirse a tópicos configurados
-        topics = (settings.MQTT_SUBSCRIBE_TOPICS or "").split(",")
-        for raw in topics:
-            topic = raw.strip()
-            if topic:
-                await manager.subscribe(topic)
-        logger.info("Connected to MQTT broker at %s:%s", settings.MQTT_BROKER_HOST, settings.MQTT_BROKER_PORT)
-    except Exception as exc:  # noqa: BLE001
-        logger.warning("MQTT connection failed: %s", exc)
+    _startup["task"] = asyncio.create_task(_init_database())
+
+    # El supervisor conecta en segundo plano y re-suscribe tras cada reconexión.
+    manager = get_mqtt_manager()
+    manager.register_message_handler(mqtt_handle_message)
+    topics = (settings.MQTT_SUBSCRIBE_TOPICS or "").split(",")
+    for raw in topics:
+        topic = raw.strip()
+        if topic:
+            await manager.subscribe(topic)
+    await manager.start()
+
+
+async def _init_database() -> None:
+    """Crea el esquema si su versión cambió (ver ``DB_SCHEMA_MODE``), reintentando hasta lograrlo."""
+    while True:
+        try:
+            created = await ensure_schema(engine, mode=settings.DB_SCHEMA_MODE)
+        except Exception as exc:  # noqa: BLE001
+            _startup["database"] = f"error: {exc.__class__.__name__}"
+            logger.warning("Database init failed: %s; retrying in %ss", exc, settings.DB_INIT_RETRY_DELAY)
+            await asyncio.sleep(settings.DB_INIT_RETRY_DELAY)
+            continue
+        _startup["database"] = "ready"
+        logger.info("Database schema %s", "created/updated" if created else "up to date")
+        # Registro de sensores en memoria, refrescado por LISTEN/NOTIFY.
+        _startup["registry"] = asyncio.create_task(get_sensor_registry().watch())
+        return
 
 
 @app.on_event("shutdown")
 async def on_shutdown() -> None:
+    for key in ("task", "registry"):
+        task = _startup[key]
+        if task is not None and not task.done():
+            task.cancel()
     try:
         await get_mqtt_manager().disconnect()
     except Exception as exc:  # noqa: BLE001
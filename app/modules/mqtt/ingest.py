@@ -5,7 +5,8 @@ from typing import Optional
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.db.session import SessionLocal
-from app.modules.sensors.service import create_reading_from_topic
+from app.modules.sensors.ingest_queue import get_ingest_queue
+from app.modules.sensors.service import resolve_reading_from_topic
 
 
 logger = logging.getLogger("mqtt_ingest")
@@ -16,9 +17,18 @@ async def handle_message(topic: str, payload: str) -> None:
 
     Espera tópicos como: sensors/<sensor_id>
     Payload esperado: número (float) o JSON con clave "value".
+
+    La lectura se escribe en bloque a través de ``IngestQueue``; los errores
+    de persistencia se propagan para que el manager no confirme el mensaje
+    (PUBACK) y el broker lo reentregue.
     """
     try:
         async with SessionLocal() as session:  # type: AsyncSession
-            await create_reading_from_topic(topic=topic, payload=payload, session=session)
+            resolved = await resolve_reading_from_topic(topic=topic, payload=payload, session=session)
+        if resolved is None:
+            return
+        sensor_id, value, ts = resolved
+        await get_ingest_queue().submit(sensor_id, value, ts)
     except Exception as exc:  # noqa: BLE001
         logger.warning("Failed to ingest MQTT message topic=%s payload=%s err=%s", topic, payload, exc)
+        raise
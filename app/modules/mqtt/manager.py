@@ -2,31 +2,273 @@ from __future__ import annotations
 
 import asyncio
 import inspect
-from typing import Callable, Optional, Awaitable
-from uuid import uuid4
-
-from gmqtt import Client as GMQTTClient
+import logging
+import random
+import socket
+import time
+from collections import deque
+from dataclasses import asdict, dataclass
+from functools import lru_cache
+from typing import TYPE_CHECKING, Callable, Deque, Dict, Iterable, List, Optional, Awaitable, Tuple
 
 from app.core.config import settings
 
+if TYPE_CHECKING:
+    from gmqtt import Client as GMQTTClient
+
 
 MessageHandler = Callable[[str, str], Optional[Awaitable[None]]]
 
+logger = logging.getLogger("mqtt.manager")
+
+
+def _default_client_id() -> str:
+    """Client id estable por host para que el broker reanude la sesión persistente."""
+    return f"sensor-hub-{socket.gethostname()}"
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Backoff exponencial con jitter: valor aleatorio en [base, min(cap, base * 2**attempt)]."""
+    ceiling = min(cap, base * (2 ** attempt))
+    return random.uniform(base, max(base, ceiling))
+
+
+# gmqtt se importa al conectar (en el supervisor) para no penalizar el arranque.
+MQTT_V311 = 4  # gmqtt.mqtt.constants.MQTTv311
+MQTT_V50 = 5  # gmqtt.mqtt.constants.MQTTv50
+PUBACK_SUCCESS = 0  # gmqtt.mqtt.constants.PubAckReasonCode.SUCCESS
+PUBACK_UNSPECIFIED_ERROR = 0x80  # gmqtt.mqtt.constants.PubAckReasonCode.UNSPECIFIED_ERROR
+
+
+@lru_cache(maxsize=None)
+def _client_class() -> type:
+    from gmqtt import Client
+    from gmqtt.mqtt.protocol import MQTTProtocol
+
+    class _SupervisedClient(Client):
+        """Cliente gmqtt sin reconexión interna; la gestiona ``MQTTManager``.
+
+        gmqtt responde a un CONNACK rc=1 con MQTT 5 bajando a 3.1.1 y llamando
+        a ``reconnect``; aquí solo se anota para que el supervisor reintente
+        con esa versión.
+        """
+
+        downgrade_requested = False
+
+        async def reconnect(self, delay: bool = False) -> None:
+            if MQTTProtocol.proto_ver < MQTT_V50:
+                self.downgrade_requested = True
+
+    return _SupervisedClient
+
+
+class TopicAliases:
+    """Asignación de topic aliases MQTT 5 (cliente -> broker) para una conexión.
+
+    El broker anuncia ``topic_alias_maximum`` en el CONNACK; los aliases solo
+    son válidos durante esa conexión.
+    """
+
+    def __init__(self, maximum: int = 0) -> None:
+        self.maximum = maximum
+        self._aliases: Dict[str, int] = {}
+
+    def resolve(self, topic: str) -> Tuple[str, Optional[int]]:
+        """Devuelve ``(topic, alias)`` a enviar; topic vacío si el alias ya está establecido."""
+        alias = self._aliases.get(topic)
+        if alias is not None:
+            return "", alias
+        if len(self._aliases) < self.maximum:
+            alias = len(self._aliases) + 1
+            self._aliases[topic] = alias
+            return topic, alias
+        return topic, None
+
+
+class PublishBufferFull(RuntimeError):
+    """Sin conexión y con el buffer de publicaciones lleno: el mensaje se descarta."""
+
+
+@dataclass
+class ConnectionStats:
+    state: str = "disconnected"
+    connects: int = 0
+    disconnects: int = 0
+    failed_attempts: int = 0
+    last_connected_at: Optional[float] = None
+    last_disconnected_at: Optional[float] = None
+    last_error: Optional[str] = None
+    buffered_publishes: int = 0
+    dropped_publishes: int = 0
+
 
 class MQTTManager:
-    """Mantiene la conexión con el broker MQTT usando gmqtt."""
+    """Mantiene la conexión con el broker MQTT usando gmqtt.
+
+    Un supervisor en segundo plano (``start``) conecta con backoff exponencial
+    con jitter, re-suscribe los tópicos registrados y vacía el buffer de
+    publicaciones pendientes tras cada reconexión. El backoff se aplica también
+    tras perder una conexión y solo se reinicia si esta duró al menos
+    ``MQTT_RECONNECT_MAX_DELAY`` segundos.
+
+    Los mensajes QoS>=1 se confirman (PUBACK) solo cuando el handler termina sin
+    error; si falla, el mensaje queda sin confirmar y se fuerza una reconexión
+    para que el broker lo reentregue al reanudar la sesión persistente. Si el
+    broker rechaza MQTT 5 se reintenta con 3.1.1 (sin topic aliases ni
+    ``receive_maximum``).
+    """
 
     def __init__(self) -> None:
         self._client: Optional[GMQTTClient] = None
         self._connected = asyncio.Event()
+        self._lost = asyncio.Event()
         self._on_message: Optional[MessageHandler] = None
+        self._inflight = asyncio.Semaphore(max(1, settings.MQTT_MAX_INFLIGHT))
+        self._subscriptions: Dict[str, int] = {}
+        self._pending: Deque[Tuple[str, str, int, bool]] = deque()
+        self._buffer_size = max(1, settings.MQTT_PUBLISH_BUFFER_SIZE)
+        self._supervisor: Optional[asyncio.Task] = None
+        self._stats = ConnectionStats()
+        self._aliases = TopicAliases()
+        self._protocol_version = MQTT_V50
+        # Fallos por (topic, payload) de mensajes pendientes de reentrega.
+        self._delivery_failures: Dict[Tuple[str, str], int] = {}
+
+    @property
+    def is_connected(self) -> bool:
+        return self._connected.is_set()
+
+    def stats(self) -> dict:
+        self._stats.buffered_publishes = len(self._pending)
+        return asdict(self._stats)
+
+    async def start(self) -> None:
+        """Lanza el supervisor de conexión si no está corriendo."""
+        if self._supervisor is None or self._supervisor.done():
+            self._supervisor = asyncio.create_task(self._supervise())
 
     async def connect(self) -> None:
-        if self._client is not None:
-            return
+        """Arranca el supervisor y espera a la primera conexión."""
+        await self.start()
+        await self._connected.wait()
 
-        client_id = settings.MQTT_CLIENT_ID or f"sensor-hub-{uuid4()}"
-        client = GMQTTClient(client_id)
+    async def disconnect(self) -> None:
+        if self._supervisor is not None:
+            # En Python < 3.12 ``wait_for`` puede tragarse la cancelación si la espera
+            # interna termina a la vez; se repite hasta que el supervisor acabe.
+            while not self._supervisor.done():
+                self._supervisor.cancel()
+                await asyncio.wait({self._supervisor}, timeout=0.1)
+            self._supervisor = None
+        await self._close_client()
+        self._stats.state = "disconnected"
+
+    async def publish(
+        self, topic: str, payload: str, qos: int = 0, retain: bool = False, *, use_alias: bool = False
+    ) -> bool:
+        """Publica el mensaje; si no hay conexión lo deja en el buffer acotado.
+
+        Devuelve ``True`` si se envió al broker y ``False`` si quedó en buffer.
+        Lanza ``PublishBufferFull`` si no hay conexión y el buffer está lleno.
+        """
+        return self._publish_nowait(topic, payload, qos, retain, use_alias)
+
+    async def publish_many(
+        self, messages: Iterable[Tuple[str, str, int, bool]], *, use_alias: bool = True
+    ) -> List[bool | BaseException]:
+        """Publica en lote por el único cliente gmqtt.
+
+        ``client.publish`` solo escribe en el transporte, así que el lote se
+        envía en bloques de ``MQTT_PUBLISH_CHUNK_SIZE`` cediendo el event loop
+        entre bloques. Devuelve, por mensaje, ``True`` (enviado), ``False``
+        (en buffer) o la excepción producida (``PublishBufferFull`` si se
+        descartó por buffer lleno).
+        """
+        chunk = max(1, settings.MQTT_PUBLISH_CHUNK_SIZE)
+        results: List[bool | BaseException] = []
+        for index, (topic, payload, qos, retain) in enumerate(messages, start=1):
+            try:
+                results.append(self._publish_nowait(topic, payload, qos, retain, use_alias))
+            except Exception as exc:  # noqa: BLE001
+                results.append(exc)
+            if index % chunk == 0:
+                await asyncio.sleep(0)
+        return results
+
+    def _publish_nowait(self, topic: str, payload: str, qos: int, retain: bool, use_alias: bool) -> bool:
+        client = self._client
+        if client is not None and self._connected.is_set():
+            if use_alias and client.protocol_version >= MQTT_V50:
+                wire_topic, alias = self._aliases.resolve(topic)
+                if alias is not None:
+                    from gmqtt import Message
+
+                    # gmqtt decide si guarda el paquete para reenvío por el argumento ``qos``, no por el del Message.
+                    client.publish(Message(wire_topic, payload, qos=qos, retain=retain, topic_alias=alias), qos=qos)
+                    return True
+            client.publish(topic, payload, qos=qos, retain=retain)
+            return True
+        if len(self._pending) >= self._buffer_size:
+            # No se desaloja lo ya encolado: quien publica recibe el rechazo.
+            self._stats.dropped_publishes += 1
+            raise PublishBufferFull(f"publish buffer full ({self._buffer_size} messages)")
+        self._pending.append((topic, payload, qos, retain))
+        return False
+
+    async def subscribe(self, topic: str, qos: Optional[int] = None) -> None:
+        """Registra la suscripción; se envía ahora si hay conexión y en cada reconexión."""
+        if qos is None:
+            qos = settings.MQTT_SUBSCRIBE_QOS
+        self._subscriptions[topic] = qos
+        if self._client is not None and self._connected.is_set():
+            self._client.subscribe(topic, qos)
+
+    def register_message_handler(self, handler: MessageHandler) -> None:
+        self._on_message = handler
+
+    async def _supervise(self) -> None:
+        attempt = 0
+        while True:
+            try:
+                await self._connect_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:  # noqa: BLE001
+                self._stats.failed_attempts += 1
+                self._stats.last_error = str(exc) or exc.__class__.__name__
+                self._stats.state = "reconnecting"
+                await self._close_client()
+                delay = backoff_delay(attempt, settings.MQTT_RECONNECT_MIN_DELAY, settings.MQTT_RECONNECT_MAX_DELAY)
+                attempt += 1
+                logger.warning("MQTT connection failed (%s); retrying in %.1fs", exc, delay)
+                await asyncio.sleep(delay)
+                continue
+
+            connected_at = time.monotonic()
+            logger.info("Connected to MQTT broker at %s:%s", settings.MQTT_BROKER_HOST, settings.MQTT_BROKER_PORT)
+            self._resubscribe()
+            self._flush_pending()
+            await self._lost.wait()
+            self._stats.state = "reconnecting"
+            await self._close_client()
+            # Solo una conexión estable reinicia el backoff; si el broker acepta y
+            # corta enseguida (p. ej. otro cliente con el mismo client id) se espera igual.
+            if time.monotonic() - connected_at >= settings.MQTT_RECONNECT_MAX_DELAY:
+                attempt = 0
+            delay = backoff_delay(attempt, settings.MQTT_RECONNECT_MIN_DELAY, settings.MQTT_RECONNECT_MAX_DELAY)
+            attempt += 1
+            logger.warning("MQTT connection lost; reconnecting in %.1fs", delay)
+            await asyncio.sleep(delay)
+
+    async def _connect_once(self) -> None:
+        client_id = settings.MQTT_CLIENT_ID or _default_client_id()
+        client = _client_class()(
+            client_id,
+            clean_session=settings.MQTT_CLEAN_SESSION,
+            optimistic_acknowledgement=False,
+            session_expiry_interval=settings.MQTT_SESSION_EXPIRY,
+            receive_maximum=max(1, settings.MQTT_MAX_INFLIGHT),
+        )
 
         if settings.MQTT_USERNAME:
             client.set_auth_credentials(settings.MQTT_USERNAME, settings.MQTT_PASSWORD or "")
@@ -36,52 +278,123 @@ class MQTTManager:
         client.on_message = self._handle_message
 
         self._client = client
-        await client.connect(settings.MQTT_BROKER_HOST, settings.MQTT_BROKER_PORT)
-        await self._connected.wait()
+        self._lost.clear()
+        self._stats.state = "connecting"
+        await asyncio.wait_for(
+            client.connect(settings.MQTT_BROKER_HOST, settings.MQTT_BROKER_PORT, version=self._protocol_version),
+            timeout=settings.MQTT_CONNECT_TIMEOUT,
+        )
+        if client.downgrade_requested:
+            self._protocol_version = MQTT_V311
+            raise ConnectionError("broker rejected MQTT 5 (CONNACK rc=1); retrying with MQTT 3.1.1")
+        if not self._connected.is_set():
+            await asyncio.wait_for(self._connected.wait(), timeout=settings.MQTT_CONNECT_TIMEOUT)
 
-    async def disconnect(self) -> None:
-        if self._client is None:
-            return
-
-        await self._client.disconnect()
-        self._client = None
+    async def _close_client(self) -> None:
+        client, self._client = self._client, None
         self._connected.clear()
+        if client is None:
+            return
+        try:
+            await client.disconnect()
+        except Exception as exc:  # noqa: BLE001
+            logger.debug("Error closing MQTT client: %s", exc)
 
-    async def publish(self, topic: str, payload: str, qos: int = 0, retain: bool = False) -> None:
-        await self._ensure_connected()
+    def _resubscribe(self) -> None:
         assert self._client is not None
-        self._client.publish(topic, payload, qos=qos, retain=retain)
+        for topic, qos in self._subscriptions.items():
+            self._client.subscribe(topic, qos)
 
-    async def subscribe(self, topic: str, qos: int = 0) -> None:
-        await self._ensure_connected()
+    def _flush_pending(self) -> None:
         assert self._client is not None
-        self._client.subscribe(topic, qos)
-
-    def register_message_handler(self, handler: MessageHandler) -> None:
-        self._on_message = handler
-
-    async def _ensure_connected(self) -> None:
-        if self._client is None:
-            await self.connect()
-        await self._connected.wait()
+        while self._pending and self._connected.is_set():
+            topic, payload, qos, retain = self._pending.popleft()
+            self._client.publish(topic, payload, qos=qos, retain=retain)
 
-    def _handle_connect(self, _client: GMQTTClient, _flags, _rc, _properties) -> None:
+    def _handle_connect(self, _client: GMQTTClient, _flags, _rc, properties) -> None:
+        maximum = (properties or {}).get("topic_alias_maximum") or 0
+        if isinstance(maximum, list):
+            maximum = maximum[0]
+        self._aliases = TopicAliases(maximum)
+        if getattr(_client, "protocol_version", MQTT_V50) < MQTT_V50:
+            logger.info("Connected with MQTT 3.1.1: topic aliases and receive_maximum are unavailable")
+        if getattr(_client, "_optimistic_acknowledgement", False):
+            logger.warning("MQTT client acks before processing: a failed ingest is not redelivered")
+        self._stats.state = "connected"
+        self._stats.connects += 1
+        self._stats.last_connected_at = time.time()
         self._connected.set()
 
-    def _handle_disconnect(self, _client: GMQTTClient, _packet, _exc: Optional[BaseException]) -> None:
+    def _handle_disconnect(self, _client: GMQTTClient, _packet, _exc: Optional[BaseException] = None) -> None:
+        if _client is not self._client:
+            return
+        if self._connected.is_set():
+            self._stats.disconnects += 1
+            self._stats.last_disconnected_at = time.time()
         self._connected.clear()
+        self._lost.set()
+
+    async def _handle_message(self, client: GMQTTClient, topic: str, payload: str, qos, properties) -> int:
+        """Procesa el mensaje y devuelve el reason code del PUBACK.
 
-    def _handle_message(self, client: GMQTTClient, topic: str, payload: str, qos, properties) -> None:
+        Con ``optimistic_acknowledgement=False`` gmqtt espera a esta corrutina
+        antes de confirmar; una excepción deja el mensaje sin confirmar y se
+        pide su reentrega. Tras ``MQTT_MAX_REDELIVERIES`` reentregas fallidas
+        (DUP) se confirma con ``0x80`` para que un mensaje que siempre falla no
+        bloquee la ingesta. El semáforo limita los mensajes en vuelo.
+        """
         if not self._on_message:
-            return
+            return PUBACK_SUCCESS
         handler = self._on_message
         # gmqtt passes payload as bytes
         payload_str = payload.decode("utf-8") if isinstance(payload, (bytes, bytearray)) else str(payload)
-        if inspect.iscoroutinefunction(handler):
-            asyncio.create_task(handler(topic, payload_str))
-        else:
-            handler(topic, payload_str)
+        key = (topic, payload_str)
+        async with self._inflight:
+            try:
+                result = handler(topic, payload_str)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as exc:
+                if not self._defers_ack(client, qos):
+                    # QoS 0 o ack ya enviado: no hay reentrega posible.
+                    return PUBACK_SUCCESS
+                dup = bool((properties or {}).get("dup"))
+                failures = self._delivery_failures.pop(key, 0) + 1 if dup else 1
+                if dup and failures > settings.MQTT_MAX_REDELIVERIES:
+                    logger.error(
+                        "Dropping MQTT message after %s failed deliveries topic=%s payload=%s err=%s",
+                        failures, topic, payload_str, exc,
+                    )
+                    return PUBACK_UNSPECIFIED_ERROR
+                self._delivery_failures[key] = failures
+                if len(self._delivery_failures) > max(1, settings.MQTT_MAX_INFLIGHT):
+                    self._delivery_failures.pop(next(iter(self._delivery_failures)))
+                self._request_redelivery(client)
+                raise
+        self._delivery_failures.pop(key, None)
+        return PUBACK_SUCCESS
+
+    @staticmethod
+    def _defers_ack(client: GMQTTClient, qos) -> bool:
+        """El PUBACK depende del resultado del handler (QoS>=1 sin ack optimista)."""
+        return (qos or 0) >= 1 and client is not None and not getattr(client, "_optimistic_acknowledgement", True)
 
+    def _request_redelivery(self, client: GMQTTClient) -> None:
+        """Fuerza una reconexión para que el broker reentregue lo no confirmado.
+
+        El broker solo reenvía PUBLISH sin PUBACK al reanudar la sesión; sin
+        reconectar, cada fallo ocuparía para siempre un hueco de
+        ``receive_maximum``. El supervisor aplica el backoff, así que fallos
+        repetidos (BD caída) no producen un bucle de reconexiones.
+        """
+        if client is not self._client or self._lost.is_set():
+            return
+        logger.warning("MQTT message handler failed; reconnecting so unacked messages are redelivered")
+        if self._connected.is_set():
+            self._stats.disconnects += 1
+            self._stats.last_disconnected_at = time.time()
+        self._connected.clear()
+        self._lost.set()
 
 _manager: Optional[MQTTManager] = None
 
@@ -1,7 +1,10 @@
-from fastapi import APIRouter, status
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.modules.mqtt.schemas import PublishMessage
-from app.modules.mqtt.service import publish_message
+from app.db.session import get_session
+from app.modules.mqtt.manager import PublishBufferFull
+from app.modules.mqtt.schemas import MQTTStatus, PublishBatch, PublishBatchResult, PublishMessage
+from app.modules.mqtt.service import get_status, publish_batch, publish_message
 
 
 router = APIRouter(prefix="/mqtt", tags=["mqtt"])
@@ -9,6 +12,22 @@ router = APIRouter(prefix="/mqtt", tags=["mqtt"])
 
 @router.post("/publish", status_code=status.HTTP_202_ACCEPTED)
 async def publish(payload: PublishMessage):
-    await publish_message(payload)
-    return {"detail": "message sent"}
+    try:
+        sent = await publish_message(payload)
+    except PublishBufferFull as exc:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(exc))
+    return {"detail": "message sent" if sent else "message queued"}
+
+
+@router.post("/publish/batch", status_code=status.HTTP_202_ACCEPTED, response_model=PublishBatchResult)
+async def publish_many(payload: PublishBatch, session: AsyncSession = Depends(get_session)):
+    try:
+        return await publish_batch(payload, session=session)
+    except ValueError as exc:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(exc))
+
+
+@router.get("/status", response_model=MQTTStatus)
+async def mqtt_status():
+    return get_status()
 
@@ -1,3 +1,5 @@
+from typing import List, Literal, Optional
+
 from pydantic import BaseModel, Field
 
 
@@ -7,3 +9,45 @@ class PublishMessage(BaseModel):
     qos: int = Field(0, ge=0, le=2)
     retain: bool = False
 
+
+class PublishTemplate(BaseModel):
+    """Plantilla expandida por sensor; admite ``{sensor_id}``, ``{name}`` y ``{location}``."""
+
+    topic: str = Field(..., min_length=1)
+    payload: str
+    qos: int = Field(0, ge=0, le=2)
+    retain: bool = False
+    sensor_ids: Optional[List[int]] = None
+    location_prefix: Optional[str] = None
+
+
+class PublishBatch(BaseModel):
+    messages: List[PublishMessage] = Field(default_factory=list)
+    template: Optional[PublishTemplate] = None
+    use_topic_alias: bool = True
+
+
+class PublishResult(BaseModel):
+    topic: str
+    status: Literal["sent", "queued", "dropped", "error"]
+    detail: Optional[str] = None
+
+
+class PublishBatchResult(BaseModel):
+    sent: int
+    queued: int
+    dropped: int
+    failed: int
+    results: List[PublishResult]
+
+
+class MQTTStatus(BaseModel):
+    state: str
+    connects: int
+    disconnects: int
+    failed_attempts: int
+    last_connected_at: Optional[float] = None
+    last_disconnected_at: Optional[float] = None
+    last_error: Optional[str] = None
+    buffered_publishes: int
+    dropped_publishes: int
@@ -1,12 +1,87 @@
-from app.modules.mqtt.manager import get_mqtt_manager
-from app.modules.mqtt.schemas import PublishMessage
+from typing import List, Tuple
 
+from sqlalchemy.ext.asyncio import AsyncSession
 
-async def publish_message(payload: PublishMessage) -> None:
+from app.core.config import settings
+from app.modules.mqtt.manager import PublishBufferFull, get_mqtt_manager
+from app.modules.mqtt.schemas import (
+    MQTTStatus,
+    PublishBatch,
+    PublishBatchResult,
+    PublishMessage,
+    PublishResult,
+    PublishTemplate,
+)
+from app.modules.sensors.service import list_sensors
+
+
+async def publish_message(payload: PublishMessage) -> bool:
+    """Publica el mensaje; devuelve ``False`` si quedó en buffer por desconexión.
+
+    Lanza ``PublishBufferFull`` si además el buffer está lleno.
+    """
     manager = get_mqtt_manager()
-    await manager.publish(
+    return await manager.publish(
         topic=payload.topic,
         payload=payload.payload,
         qos=payload.qos,
         retain=payload.retain,
     )
+
+
+async def publish_batch(batch: PublishBatch, session: AsyncSession) -> PublishBatchResult:
+    """Publica mensajes explícitos y/o una plantilla expandida sobre sensores.
+
+    Lanza ``ValueError`` si la plantilla es inválida o el lote supera el máximo.
+    """
+    messages: List[Tuple[str, str, int, bool]] = [
+        (m.topic, m.payload, m.qos, m.retain) for m in batch.messages
+    ]
+    if batch.template is not None:
+        messages.extend(await _expand_template(batch.template, session))
+
+    if len(messages) > settings.MQTT_PUBLISH_BATCH_MAX:
+        raise ValueError(f"Batch exceeds {settings.MQTT_PUBLISH_BATCH_MAX} messages")
+
+    outcomes = await get_mqtt_manager().publish_many(messages, use_alias=batch.use_topic_alias)
+
+    results: List[PublishResult] = []
+    sent = queued = dropped = failed = 0
+    for (topic, *_), outcome in zip(messages, outcomes):
+        if isinstance(outcome, PublishBufferFull):
+            dropped += 1
+            results.append(PublishResult(topic=topic, status="dropped", detail=str(outcome)))
+        elif isinstance(outcome, BaseException):
+            failed += 1
+            results.append(PublishResult(topic=topic, status="error", detail=str(outcome)))
+        elif outcome:
+            sent += 1
+            results.append(PublishResult(topic=topic, status="sent"))
+        else:
+            queued += 1
+            results.append(PublishResult(topic=topic, status="queued"))
+    return PublishBatchResult(sent=sent, queued=queued, dropped=dropped, failed=failed, results=results)
+
+
+async def _expand_template(template: PublishTemplate, session: AsyncSession) -> List[Tuple[str, str, int, bool]]:
+    sensors = await list_sensors(session=session)
+    if template.sensor_ids is not None:
+        wanted = set(template.sensor_ids)
+        sensors = [s for s in sensors if s.id in wanted]
+    if template.location_prefix:
+        sensors = [s for s in sensors if (s.location or "").startswith(template.location_prefix)]
+
+    expanded: List[Tuple[str, str, int, bool]] = []
+    for sensor in sensors:
+        fields = {"sensor_id": sensor.id, "name": sensor.name, "location": sensor.location or ""}
+        try:
+            topic = template.topic.format_map(fields)
+            payload = template.payload.format_map(fields)
+        except (KeyError, IndexError, ValueError) as exc:
+            raise ValueError(f"Invalid template placeholder: {exc}") from exc
+        expanded.append((topic, payload, template.qos, template.retain))
+    return expanded
+
+
+def get_status() -> MQTTStatus:
+    return MQTTStatus(**get_mqtt_manager().stats())
@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+from collections import deque
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from typing import Deque, Dict, Optional, Set
+
+from app.core.config import settings
+
+
+@dataclass
+class DedupStats:
+    accepted: int = 0
+    duplicates_memory: int = 0
+    duplicates_db: int = 0
+    out_of_order: int = 0
+
+
+class _RecentTimestamps:
+    __slots__ = ("order", "members", "latest")
+
+    def __init__(self) -> None:
+        self.order: Deque[datetime] = deque()
+        self.members: Set[datetime] = set()
+        self.latest: Optional[datetime] = None
+
+
+class ReadingDeduplicator:
+    """Filtro en memoria de duplicados ``(sensor_id, timestamp)`` por sensor.
+
+    Guarda los últimos ``window`` timestamps confirmados de cada sensor. Es
+    solo un atajo: la restricción única en BD sigue siendo la garantía.
+    ``remember`` debe llamarse tras el commit para que un fallo de BD no
+    descarte la reentrega del mensaje.
+    """
+
+    def __init__(self, window: int) -> None:
+        self.window = max(1, window)
+        self._recent: Dict[int, _RecentTimestamps] = {}
+        self.stats = DedupStats()
+
+    def is_duplicate(self, sensor_id: int, ts: datetime) -> bool:
+        if ts.tzinfo is None:
+            # Sin zona no es comparable con lo devuelto por la BD; decide la restricción única.
+            return False
+        recent = self._recent.get(sensor_id)
+        if recent is not None and ts in recent.members:
+            self.stats.duplicates_memory += 1
+            return True
+        return False
+
+    def remember(self, sensor_id: int, ts: datetime) -> None:
+        recent = self._recent.get(sensor_id)
+        if recent is None:
+            recent = self._recent[sensor_id] = _RecentTimestamps()
+        self.stats.accepted += 1
+        if recent.latest is not None and ts < recent.latest:
+            self.stats.out_of_order += 1
+        else:
+            recent.latest = ts
+        if ts in recent.members:
+            return
+        recent.order.append(ts)
+        recent.members.add(ts)
+        if len(recent.order) > self.window:
+            recent.members.discard(recent.order.popleft())
+
+    def record_db_duplicate(self) -> None:
+        self.stats.duplicates_db += 1
+
+    def snapshot(self) -> dict:
+        return asdict(self.stats)
+
+
+_dedup: Optional[ReadingDeduplicator] = None
+
+
+def get_deduplicator() -> ReadingDeduplicator:
+    global _dedup
+    if _dedup is None:
+        _dedup = ReadingDeduplicator(settings.INGEST_DEDUP_WINDOW)
+    return _dedup
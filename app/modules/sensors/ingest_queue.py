@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from datetime import datetime
+from typing import Awaitable, Callable, List, Optional, Set
+
+from sqlalchemy.exc import DataError, IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.modules.sensors.batch import ReadingBatch
+from app.modules.sensors.service import create_readings
+
+
+logger = logging.getLogger("sensors.ingest_queue")
+
+BatchWriter = Callable[[ReadingBatch], Awaitable[int]]
+
+
+async def _write_batch(batch: ReadingBatch) -> int:
+    async with SessionLocal() as session:  # type: AsyncSession
+        return await create_readings(batch, session)
+
+
+class IngestQueue:
+    """Agrupa lecturas en un ``ReadingBatch`` y las escribe en bloque.
+
+    ``submit`` espera a que el lote que contiene la lectura se confirme en BD
+    (o falle), así el ack MQTT diferido sigue significando "persistido".
+    El lote se escribe al llegar a ``max_batch`` lecturas o tras ``max_delay``
+    segundos desde la primera lectura pendiente. Si la BD rechaza una fila,
+    el lote se divide hasta aislarla y el resto se confirma normalmente.
+    """
+
+    def __init__(self, max_batch: int, max_delay: float, writer: BatchWriter = _write_batch) -> None:
+        self.max_batch = max(1, max_batch)
+        self.max_delay = max_delay
+        self._writer = writer
+        self._batch = ReadingBatch()
+        self._waiters: List[asyncio.Future] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._writes: Set[asyncio.Task] = set()
+
+    async def submit(self, sensor_id: int, value: float, ts: Optional[datetime] = None) -> None:
+        waiter = asyncio.get_running_loop().create_future()
+        self._batch.append(sensor_id, ts, value)
+        self._waiters.append(waiter)
+        if len(self._batch) >= self.max_batch:
+            self._flush_now()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.max_delay, self._flush_now)
+        await waiter
+
+    def _flush_now(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._waiters:
+            return
+        batch, waiters = self._batch, self._waiters
+        self._batch, self._waiters = ReadingBatch(), []
+        task = asyncio.create_task(self._write(batch, waiters))
+        self._writes.add(task)
+        task.add_done_callback(self._writes.discard)
+
+    async def _write(self, batch: ReadingBatch, waiters: List[asyncio.Future]) -> None:
+        try:
+            inserted = await self._writer(batch)
+        except (IntegrityError, DataError) as exc:
+            if len(batch) > 1:
+                # Error propio de alguna fila (p. ej. FK de un sensor borrado):
+                # se reintenta por mitades para que solo fallen las culpables.
+                mid = len(batch) // 2
+                await self._write(batch.slice(0, mid), waiters[:mid])
+                await self._write(batch.slice(mid, len(batch)), waiters[mid:])
+                return
+            self._fail(batch, waiters, exc)
+            return
+        except Exception as exc:  # noqa: BLE001
+            self._fail(batch, waiters, exc)
+            return
+        logger.debug("Wrote batch of %s readings (%s new)", len(batch), inserted)
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+
+    @staticmethod
+    def _fail(batch: ReadingBatch, waiters: List[asyncio.Future], exc: Exception) -> None:
+        logger.warning("Failed to write batch of %s readings: %s", len(batch), exc)
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_exception(exc)
+
+
+_queue: Optional[IngestQueue] = None
+
+
+def get_ingest_queue() -> IngestQueue:
+    global _queue
+    if _queue is None:
+        # Cada lectura pendiente retiene un mensaje MQTT en vuelo: un lote mayor
+        # que MQTT_MAX_INFLIGHT nunca se llenaría y siempre esperaría el timer.
+        max_batch = min(settings.INGEST_BATCH_SIZE, settings.MQTT_MAX_INFLIGHT)
+        _queue = IngestQueue(max_batch, settings.INGEST_BATCH_DELAY)
+    return _queue
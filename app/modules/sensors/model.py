@@ -1,6 +1,6 @@
 from datetime import datetime
 
-from sqlalchemy import DateTime, Float, ForeignKey, Integer, String, func
+from sqlalchemy import DateTime, Float, ForeignKey, Integer, String, UniqueConstraint, func
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from app.db.base import Base
@@ -8,6 +8,7 @@ from app.db.base import Base
 
 class Sensor(Base):
     __tablename__ = "sensors"
+    __table_args__ = (UniqueConstraint("name", name="uq_sensors_name"),)
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
     name: Mapped[str] = mapped_column(String(100), nullable=False)
@@ -18,8 +19,49 @@ class Sensor(Base):
     )
 
 
+# DDL adicional ejecutado por ``ensure_schema`` (ver ``app/db/schema.py``):
+# - En BDs anteriores a ``uq_sensors_name`` fusiona los sensores con el mismo nombre
+#   en el más antiguo (sus lecturas pasan a él; si coinciden en timestamp se conserva
+#   la del sensor más antiguo) y crea el índice único (una vez).
+# - Notifica cambios en ``sensors`` para refrescar el registro en memoria de cada réplica.
+Sensor.__table__.info["ddl"] = [
+    """
+    DO $$
+    BEGIN
+        IF to_regclass('uq_sensors_name') IS NULL THEN
+            CREATE TEMP TABLE sensor_name_groups ON COMMIT DROP AS
+                SELECT id, min(id) OVER (PARTITION BY name) AS keep_id FROM sensors;
+            DELETE FROM sensor_readings r
+            USING sensor_name_groups g, sensor_readings k, sensor_name_groups gk
+            WHERE r.sensor_id = g.id AND k.sensor_id = gk.id AND gk.keep_id = g.keep_id
+              AND k.timestamp = r.timestamp AND k.sensor_id < r.sensor_id;
+            UPDATE sensor_readings r SET sensor_id = g.keep_id
+            FROM sensor_name_groups g WHERE r.sensor_id = g.id AND g.id <> g.keep_id;
+            DELETE FROM sensors s USING sensor_name_groups g WHERE s.id = g.id AND g.id <> g.keep_id;
+            CREATE UNIQUE INDEX uq_sensors_name ON sensors (name);
+        END IF;
+    END
+    $$
+    """,
+    """
+    CREATE OR REPLACE FUNCTION notify_sensors_changed() RETURNS trigger AS $$
+    BEGIN
+        PERFORM pg_notify('sensors_changed', '');
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS sensors_changed ON sensors",
+    """
+    CREATE TRIGGER sensors_changed AFTER INSERT OR UPDATE OR DELETE ON sensors
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_sensors_changed()
+    """,
+]
+
+
 class SensorReading(Base):
     __tablename__ = "sensor_readings"
+    __table_args__ = (UniqueConstraint("sensor_id", "timestamp", name="uq_sensor_readings_sensor_ts"),)
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
     sensor_id: Mapped[int] = mapped_column(ForeignKey("sensors.id", ondelete="CASCADE"))
@@ -30,3 +72,19 @@ class SensorReading(Base):
 
     sensor: Mapped[Sensor] = relationship(back_populates="readings")
 
+
+# ``create_all`` no altera tablas existentes: en BDs anteriores a la restricción
+# única se eliminan los duplicados y se crea el índice único equivalente (una vez).
+SensorReading.__table__.info["ddl"] = [
+    """
+    DO $$
+    BEGIN
+        IF to_regclass('uq_sensor_readings_sensor_ts') IS NULL THEN
+            DELETE FROM sensor_readings a USING sensor_readings b
+            WHERE a.sensor_id = b.sensor_id AND a.timestamp = b.timestamp AND a.id > b.id;
+            CREATE UNIQUE INDEX uq_sensor_readings_sensor_ts ON sensor_readings (sensor_id, timestamp);
+        END IF;
+    END
+    $$
+    """,
+]
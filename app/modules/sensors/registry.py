@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import re
+from typing import Dict, List, Optional, Set
+
+from sqlalchemy import make_url, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.modules.sensors.model import Sensor as SensorModel
+from app.modules.sensors.schemas import Sensor
+
+
+logger = logging.getLogger("sensors.registry")
+
+# Canal emitido por el trigger de la tabla ``sensors`` (ver ``model.py``).
+CHANGE_CHANNEL = "sensors_changed"
+
+
+class SensorRegistry:
+    """Metadata de todos los sensores en memoria.
+
+    Se carga una vez y se refresca al recibir ``NOTIFY sensors_changed``
+    (``watch``), con un refresco periódico de respaldo. Resuelve identificadores
+    de MQTT sin consultar la BD y, si ``SENSOR_AUTO_PROVISION`` está activo,
+    crea en bloque los sensores desconocidos cuyo nombre cumple
+    ``SENSOR_AUTO_PROVISION_PATTERN``.
+    """
+
+    def __init__(self) -> None:
+        self._by_id: Dict[int, Sensor] = {}
+        self._by_name: Dict[str, int] = {}
+        self._by_lower_name: Dict[str, int] = {}
+        self._loaded = False
+        self._load_lock = asyncio.Lock()
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._provision_timer: Optional[asyncio.TimerHandle] = None
+        self._provisions: Set[asyncio.Task] = set()
+
+    async def ensure_loaded(self, session: AsyncSession) -> None:
+        if self._loaded:
+            return
+        async with self._load_lock:
+            if not self._loaded:
+                await self.refresh(session)
+
+    async def refresh(self, session: AsyncSession) -> None:
+        result = await session.execute(select(SensorModel).order_by(SensorModel.id))
+        self._replace([Sensor.model_validate(s) for s in result.scalars().all()])
+
+    def all(self) -> List[Sensor]:
+        return list(self._by_id.values())
+
+    def get(self, sensor_id: int) -> Optional[Sensor]:
+        return self._by_id.get(sensor_id)
+
+    def resolve(self, identifier: Optional[str]) -> Optional[int]:
+        """Resuelve por id numérico, nombre exacto o nombre sin distinguir mayúsculas."""
+        if not identifier:
+            return None
+        try:
+            sensor_id = int(identifier)
+        except ValueError:
+            pass
+        else:
+            if sensor_id in self._by_id:
+                return sensor_id
+        sensor_id = self._by_name.get(identifier)
+        if sensor_id is not None:
+            return sensor_id
+        return self._by_lower_name.get(identifier.lower())
+
+    def can_provision(self, name: str) -> bool:
+        if not settings.SENSOR_AUTO_PROVISION or name.isdigit():
+            return False
+        return re.fullmatch(settings.SENSOR_AUTO_PROVISION_PATTERN, name) is not None
+
+    async def provision(self, name: str) -> int:
+        """Crea el sensor ``name`` (agrupado con otras altas cercanas) y devuelve su id."""
+        sensor_id = self.resolve(name)
+        if sensor_id is not None:
+            return sensor_id
+        waiter = self._pending.get(name)
+        if waiter is None:
+            waiter = self._pending[name] = asyncio.get_running_loop().create_future()
+            if self._provision_timer is None:
+                self._provision_timer = asyncio.get_running_loop().call_later(
+                    settings.SENSOR_PROVISION_DELAY, self._start_provision
+                )
+        return await asyncio.shield(waiter)
+
+    async def watch(self) -> None:
+        """Escucha ``NOTIFY`` en una conexión dedicada y recarga la metadata; reintenta si se corta."""
+        import psycopg
+
+        dsn = make_url(settings.DATABASE_URL).set(drivername="postgresql").render_as_string(hide_password=False)
+        while True:
+            try:
+                async with await psycopg.AsyncConnection.connect(dsn, autocommit=True) as conn:
+                    await conn.execute(f"LISTEN {CHANGE_CHANNEL}")
+                    await self._reload()
+                    while True:
+                        # Termina con la primera notificación o al vencer el refresco periódico.
+                        async for _ in conn.notifies(timeout=settings.SENSOR_REGISTRY_REFRESH, stop_after=1):
+                            pass
+                        await self._reload()
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:  # noqa: BLE001
+                logger.warning("Sensor registry watch failed: %s; retrying", exc)
+                await asyncio.sleep(settings.DB_INIT_RETRY_DELAY)
+
+    async def _reload(self) -> None:
+        async with SessionLocal() as session:
+            await self.refresh(session)
+
+    def _start_provision(self) -> None:
+        self._provision_timer = None
+        pending, self._pending = self._pending, {}
+        task = asyncio.create_task(self._create_sensors(pending))
+        self._provisions.add(task)
+        task.add_done_callback(self._provisions.discard)
+
+    async def _create_sensors(self, pending: Dict[str, asyncio.Future]) -> None:
+        names = list(pending)
+        try:
+            async with SessionLocal() as session:
+                # Otra réplica puede crear el mismo nombre a la vez: el índice único
+                # ``uq_sensors_name`` descarta el conflicto y esas filas se releen.
+                result = await session.execute(
+                    pg_insert(SensorModel)
+                    .values([{"name": name} for name in names])
+                    .on_conflict_do_nothing(index_elements=[SensorModel.name])
+                    .returning(SensorModel)
+                )
+                created = list(result.scalars().all())
+                conflicted = set(names) - {s.name for s in created}
+                existing = []
+                if conflicted:
+                    result = await session.execute(select(SensorModel).where(SensorModel.name.in_(conflicted)))
+                    existing = list(result.scalars().all())
+                await session.commit()
+                sensors = [Sensor.model_validate(s) for s in (*existing, *created)]
+        except Exception as exc:  # noqa: BLE001
+            logger.warning("Failed to auto-provision sensors %s: %s", list(pending), exc)
+            for waiter in pending.values():
+                if not waiter.done():
+                    waiter.set_exception(exc)
+            return
+
+        if created:
+            logger.info("Auto-provisioned sensors %s", [s.name for s in created])
+        self._replace([*self._by_id.values(), *sensors])
+        for name, waiter in pending.items():
+            if not waiter.done():
+                waiter.set_result(self._by_name[name])
+
+    def _replace(self, sensors: List[Sensor]) -> None:
+        by_id = {s.id: s for s in sorted(sensors, key=lambda s: s.id)}
+        by_name: Dict[str, int] = {}
+        by_lower: Dict[str, int] = {}
+        for sensor in by_id.values():
+            by_name.setdefault(sensor.name, sensor.id)
+            by_lower.setdefault(sensor.name.lower(), sensor.id)
+        # Reemplazo atómico para lecturas concurrentes sin lock.
+        self._by_id, self._by_name, self._by_lower_name = by_id, by_name, by_lower
+        self._loaded = True
+
+
+_registry: Optional[SensorRegistry] = None
+
+
+def get_sensor_registry() -> SensorRegistry:
+    global _registry
+    if _registry is None:
+        _registry = SensorRegistry()
+    return _registry
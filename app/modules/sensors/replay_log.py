@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import deque
+from typing import Deque, Dict, Iterable, List, Optional, Set, Tuple
+
+from app.core.config import settings
+
+
+class ReadingListener:
+    """Cola de lecturas en vivo para un cliente SSE/long-poll."""
+
+    def __init__(self, sensor_ids: Optional[Set[int]], maxsize: int) -> None:
+        self.sensor_ids = sensor_ids
+        self.queue: asyncio.Queue[dict] = asyncio.Queue(maxsize=maxsize)
+        self.overflowed = False
+
+    def wants(self, sensor_id: int) -> bool:
+        return self.sensor_ids is None or sensor_id in self.sensor_ids
+
+
+class ReplayLog:
+    """Log en memoria de lecturas recientes por sensor, acotado por cantidad y antigüedad.
+
+    El id de evento es el ``id`` de la fila en ``sensor_readings``, estable
+    entre reinicios; el servicio publica en orden creciente de id porque
+    serializa insert, commit y ``append`` (ver ``_write_lock``). ``_complete_after`` guarda, por sensor, el id a
+    partir del cual el log contiene todas las lecturas: si el ``Last-Event-ID``
+    del cliente es menor, el hueco se completa desde la BD.
+    """
+
+    def __init__(self, max_events: int, max_age: float) -> None:
+        self.max_events = max_events
+        self.max_age = max_age
+        self._logs: Dict[int, Deque[Tuple[int, float, dict]]] = {}
+        self._evicted: Dict[int, int] = {}
+        self._evicted_any = 0
+        self._boot_floor: Optional[int] = None
+        self._listeners: Set[ReadingListener] = set()
+
+    def append(self, sensor_id: int, event_id: int, payload: dict) -> None:
+        if self._boot_floor is None:
+            self._boot_floor = event_id - 1
+        log = self._logs.setdefault(sensor_id, deque())
+        log.append((event_id, time.monotonic(), payload))
+        if len(log) > self.max_events:
+            self._evict(sensor_id, log.popleft()[0])
+        self._expire(sensor_id, log)
+
+        for listener in tuple(self._listeners):
+            if not listener.wants(sensor_id):
+                continue
+            try:
+                listener.queue.put_nowait(payload)
+            except asyncio.QueueFull:
+                # El cliente no sigue el ritmo: se le desconecta y reanuda con Last-Event-ID.
+                listener.overflowed = True
+                self._listeners.discard(listener)
+
+    def since(self, after_id: int, sensor_ids: Optional[Iterable[int]] = None) -> Optional[List[dict]]:
+        """Lecturas con id > ``after_id`` o ``None`` si el log no cubre el hueco."""
+        ids = list(self._logs) if sensor_ids is None else list(sensor_ids)
+        for sensor_id in ids:
+            log = self._logs.get(sensor_id)
+            if log is not None:
+                self._expire(sensor_id, log)
+        if after_id < self._complete_after(None if sensor_ids is None else ids):
+            return None
+        events = [
+            payload
+            for sensor_id in ids
+            for event_id, _, payload in self._logs.get(sensor_id, ())
+            if event_id > after_id
+        ]
+        events.sort(key=lambda p: p["id"])
+        return events
+
+    def listen(self, sensor_ids: Optional[Iterable[int]] = None) -> ReadingListener:
+        listener = ReadingListener(
+            set(sensor_ids) if sensor_ids is not None else None,
+            maxsize=settings.SSE_QUEUE_SIZE,
+        )
+        self._listeners.add(listener)
+        return listener
+
+    def unlisten(self, listener: ReadingListener) -> None:
+        self._listeners.discard(listener)
+
+    def _complete_after(self, sensor_ids: Optional[List[int]]) -> float:
+        if self._boot_floor is None:
+            return float("inf")
+        if sensor_ids is None:
+            return max(self._boot_floor, self._evicted_any)
+        evicted = max((self._evicted.get(sid, 0) for sid in sensor_ids), default=0)
+        return max(self._boot_floor, evicted)
+
+    def _expire(self, sensor_id: int, log: Deque[Tuple[int, float, dict]]) -> None:
+        cutoff = time.monotonic() - self.max_age
+        while log and log[0][1] < cutoff:
+            self._evict(sensor_id, log.popleft()[0])
+
+    def _evict(self, sensor_id: int, event_id: int) -> None:
+        self._evicted[sensor_id] = max(self._evicted.get(sensor_id, 0), event_id)
+        self._evicted_any = max(self._evicted_any, event_id)
+
+
+_log: Optional[ReplayLog] = None
+
+
+def get_replay_log() -> ReplayLog:
+    global _log
+    if _log is None:
+        _log = ReplayLog(settings.SSE_REPLAY_MAX_EVENTS, settings.SSE_REPLAY_MAX_AGE)
+    return _log
@@ -1,17 +1,26 @@
+import asyncio
+import json
 from datetime import datetime
-from typing import List, Optional
+from typing import AsyncIterator, List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Query, WebSocket, WebSocketDisconnect, status
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, WebSocket, WebSocketDisconnect, status
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.db.session import get_session
-from app.modules.sensors.schemas import Sensor, SensorReading
+from app.core.config import settings
+from app.db.session import SessionLocal, get_session
+from app.modules.sensors.dedup import get_deduplicator
+from app.modules.sensors.replay_log import get_replay_log
+from app.modules.sensors.schemas import IngestStats, ReadingPoll, Sensor, SensorReading, SubscriptionControl
 from app.modules.sensors.service import (
     get_sensor as svc_get_sensor,
     list_readings as svc_list_readings,
+    iter_reading_batches as svc_iter_reading_batches,
     list_sensors as svc_list_sensors,
+    readings_after as svc_readings_after,
 )
-from app.modules.sensors.websocket_manager import get_sensor_ws_manager
+from app.modules.sensors.websocket_manager import Aggregation, get_sensor_ws_manager
 from app.utils.common import paginate
 
 
@@ -28,6 +37,98 @@ async def list_sensors(
     return paginate(sensors, skip=skip, limit=limit)
 
 
+@router.get("/ingest/stats", response_model=IngestStats)
+async def ingest_stats():
+    return IngestStats(**get_deduplicator().snapshot())
+
+
+@router.get("/stream")
+async def stream_readings(
+    request: Request,
+    sensor_ids: Optional[List[int]] = Query(None, alias="sensor_id"),
+    last_event_id: Optional[int] = Header(None, alias="Last-Event-ID"),
+    after: Optional[int] = Query(None, description="Alternativa a Last-Event-ID"),
+):
+    """Server-Sent Events con lecturas en vivo; reanuda desde ``Last-Event-ID``."""
+    resume_from = last_event_id if last_event_id is not None else after
+    return StreamingResponse(
+        _sse_events(request, sensor_ids, resume_from),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/poll", response_model=ReadingPoll)
+async def poll_readings(
+    sensor_ids: Optional[List[int]] = Query(None, alias="sensor_id"),
+    after: Optional[int] = Query(None, description="Último id de evento recibido"),
+    timeout: float = Query(25.0, gt=0, le=60),
+):
+    """Long-poll: devuelve lecturas con id > ``after`` o espera hasta ``timeout`` segundos.
+
+    La sesión de BD solo se abre para leer el hueco, no durante la espera.
+    """
+    log = get_replay_log()
+    listener = log.listen(sensor_ids)
+    try:
+        readings: List[dict] = []
+        if after is not None:
+            async with SessionLocal() as session:
+                readings = await svc_readings_after(after, session, sensor_ids=sensor_ids)
+        if not readings:
+            try:
+                readings.append(await asyncio.wait_for(listener.queue.get(), timeout=timeout))
+            except asyncio.TimeoutError:
+                pass
+            while not listener.queue.empty():
+                readings.append(listener.queue.get_nowait())
+            if after is not None:
+                readings = [r for r in readings if r["id"] > after]
+    finally:
+        log.unlisten(listener)
+    last = readings[-1]["id"] if readings else after
+    return ReadingPoll(last_event_id=last, readings=readings)
+
+
+async def _sse_events(
+    request: Request, sensor_ids: Optional[List[int]], last_event_id: Optional[int]
+) -> AsyncIterator[str]:
+    log = get_replay_log()
+    # Escuchar antes de leer el hueco para no perder lecturas intermedias.
+    listener = log.listen(sensor_ids)
+    cursor = last_event_id
+    try:
+        yield "retry: 3000\n\n"
+        if last_event_id is not None:
+            # Paginar hasta cerrar el hueco: una página completa indica que quedan filas en BD.
+            while True:
+                async with SessionLocal() as session:
+                    backlog = await svc_readings_after(cursor, session, sensor_ids=sensor_ids)
+                for event in backlog:
+                    cursor = event["id"]
+                    yield _sse_format(event)
+                if len(backlog) < settings.SSE_REPLAY_DB_LIMIT:
+                    break
+        while not (listener.overflowed and listener.queue.empty()):
+            if await request.is_disconnected():
+                break
+            try:
+                event = await asyncio.wait_for(listener.queue.get(), timeout=settings.SSE_HEARTBEAT)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            if cursor is not None and event["id"] <= cursor:
+                continue
+            cursor = event["id"]
+            yield _sse_format(event)
+    finally:
+        log.unlisten(listener)
+
+
+def _sse_format(event: dict) -> str:
+    return f"id: {event['id']}\nevent: reading\ndata: {json.dumps(event)}\n\n"
+
+
 @router.get("/{sensor_id}", response_model=Sensor)
 async def get_sensor(sensor_id: int, session: AsyncSession = Depends(get_session)):
     sensor = await svc_get_sensor(sensor_id=sensor_id, session=session)
@@ -46,17 +147,64 @@ async def get_readings(
     return await svc_list_readings(sensor_id=sensor_id, since=since, limit=limit, session=session)
 
 
+@router.get("/{sensor_id}/readings/export")
+async def export_readings(
+    sensor_id: int,
+    since: Optional[datetime] = Query(None, description="ISO-8601 datetime filter"),
+    until: Optional[datetime] = Query(None, description="ISO-8601 datetime filter (exclusive)"),
+):
+    """Exporta las lecturas de un sensor como CSV en streaming (``timestamp,value``)."""
+    return StreamingResponse(
+        _csv_rows(sensor_id, since, until),
+        media_type="text/csv",
+        headers={"Content-Disposition": f'attachment; filename="sensor-{sensor_id}.csv"'},
+    )
+
+
+async def _csv_rows(sensor_id: int, since: Optional[datetime], until: Optional[datetime]) -> AsyncIterator[str]:
+    yield "timestamp,value\n"
+    async with SessionLocal() as session:
+        async for batch in svc_iter_reading_batches(sensor_id, session, since=since, until=until):
+            yield "".join(f"{row.timestamp.isoformat()},{row.value!r}\n" for row in batch)
+
+
 @router.websocket("/ws")
-async def sensor_stream(websocket: WebSocket, sensor_id: int | None = Query(None)):
+async def sensor_stream(
+    websocket: WebSocket,
+    sensor_id: int | None = Query(None),
+    max_hz: float | None = Query(None, gt=0, le=100, description="Máximo de frames por segundo"),
+    agg: Aggregation = Query("last", description="Agregación por tick: last, avg o minmax"),
+):
+    """Stream de lecturas en vivo.
+
+    Sin ``sensor_id`` se reciben todas las lecturas. El cliente puede ajustar
+    sus filtros enviando mensajes de control JSON, p. ej.
+    ``{"action": "subscribe", "sensor_ids": [1, 2], "locations": ["plant-a/"], "metrics": ["temp*"]}``.
+
+    Con ``max_hz`` las lecturas se agrupan por sensor y se envían como un
+    único frame ``{"type": "readings", ...}`` por tick.
+    """
     await websocket.accept()
     manager = get_sensor_ws_manager()
-    await manager.connect(websocket, sensor_id)
+    await manager.connect(websocket, sensor_id, max_hz=max_hz, agg=agg)
     try:
-        # Keep the connection open; we ignore incoming client messages.
         while True:
-            await websocket.receive_text()
+            raw = await websocket.receive_text()
+            try:
+                control = SubscriptionControl.model_validate_json(raw)
+            except ValidationError as exc:
+                await websocket.send_json({"type": "error", "detail": exc.errors(include_url=False, include_context=False)})
+                continue
+            apply = manager.subscribe if control.action == "subscribe" else manager.unsubscribe
+            sub = apply(
+                websocket,
+                all=control.all,
+                sensor_ids=control.sensor_ids,
+                locations=control.locations,
+                metrics=control.metrics,
+            )
+            await websocket.send_json({"type": "subscription", **sub.to_dict()})
     except WebSocketDisconnect:
         pass
     finally:
-        await manager.disconnect(websocket, sensor_id)
-
+        await manager.disconnect(websocket)
@@ -1,5 +1,7 @@
 from datetime import datetime
-from pydantic import BaseModel, ConfigDict
+from typing import List, Literal, Optional
+
+from pydantic import BaseModel, ConfigDict, Field
 
 
 class Sensor(BaseModel):
@@ -17,3 +19,28 @@ class SensorReading(BaseModel):
 
     model_config = ConfigDict(from_attributes=True)
 
+
+class ReadingEvent(SensorReading):
+    id: int
+
+
+class ReadingPoll(BaseModel):
+    last_event_id: Optional[int] = None
+    readings: List[ReadingEvent]
+
+
+class IngestStats(BaseModel):
+    accepted: int
+    duplicates_memory: int
+    duplicates_db: int
+    out_of_order: int
+
+
+class SubscriptionControl(BaseModel):
+    """Mensaje de control recibido por ``/sensors/ws``."""
+
+    action: Literal["subscribe", "unsubscribe"]
+    all: bool = False
+    sensor_ids: List[int] = Field(default_factory=list)
+    locations: List[str] = Field(default_factory=list)
+    metrics: List[str] = Field(default_factory=list)
@@ -1,51 +1,236 @@
-﻿from datetime import datetime
-from typing import List, Optional
+﻿import asyncio
+from datetime import datetime
+from typing import AsyncIterator, List, Optional, Set, Tuple
 
 from sqlalchemy import select, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.core.config import settings
+from app.modules.sensors.batch import ReadingBatch, fits_epoch_ns, from_epoch_ns
+from app.modules.sensors.dedup import get_deduplicator
 from app.modules.sensors.model import Sensor as SensorModel
 from app.modules.sensors.model import SensorReading as SensorReadingModel
+from app.modules.sensors.registry import get_sensor_registry
+from app.modules.sensors.replay_log import get_replay_log
 from app.modules.sensors.schemas import Sensor, SensorReading
 from app.modules.sensors.websocket_manager import get_sensor_ws_manager
 
 
 async def list_sensors(session: AsyncSession) -> List[Sensor]:
-    result = await session.execute(select(SensorModel))
-    sensors = result.scalars().all()
-    return [Sensor.model_validate(sensor) for sensor in sensors]
+    registry = get_sensor_registry()
+    await registry.ensure_loaded(session)
+    return registry.all()
 
 
 async def get_sensor(sensor_id: int, session: AsyncSession) -> Sensor | None:
+    registry = get_sensor_registry()
+    await registry.ensure_loaded(session)
+    sensor = registry.get(sensor_id)
+    if sensor is not None:
+        return sensor
+    # Fallo de caché: puede ser un alta aún no notificada.
     result = await session.execute(select(SensorModel).where(SensorModel.id == sensor_id))
-    sensor = result.scalar_one_or_none()
-    if sensor is None:
+    model = result.scalar_one_or_none()
+    if model is None:
         return None
-    return Sensor.model_validate(sensor)
+    await registry.refresh(session)
+    return Sensor.model_validate(model)
+
+
+# Serializa insert -> commit -> replay log dentro del proceso: los ids se
+# asignan y publican en orden creciente, así que el id sirve como cursor de
+# SSE/long-poll sin saltarse filas confirmadas más tarde con id menor. El
+# envío por WebSocket (que no usa el id) queda fuera del lock.
+_write_lock = asyncio.Lock()
 
 
-async def create_reading(sensor_id: int, value: float, session: AsyncSession, *, ts: Optional[datetime] = None) -> None:
-    reading = SensorReadingModel(sensor_id=sensor_id, value=value)
+async def create_reading(sensor_id: int, value: float, session: AsyncSession, *, ts: Optional[datetime] = None) -> bool:
+    """Inserta una lectura de forma idempotente; devuelve ``False`` si era duplicada."""
+    dedup = get_deduplicator()
+    if ts is not None and dedup.is_duplicate(sensor_id, ts):
+        return False
+
+    values = {"sensor_id": sensor_id, "value": value}
     if ts is not None:
-        reading.timestamp = ts
-    session.add(reading)
-    await session.commit()
-    await session.refresh(reading)
+        values["timestamp"] = ts
+    async with _write_lock:
+        result = await session.execute(
+            _insert_ignoring_duplicates(values).returning(
+                SensorReadingModel.id, SensorReadingModel.timestamp
+            )
+        )
+        row = result.first()
+        await session.commit()
+        if row is not None:
+            _append_replay(sensor_id, row.id, row.timestamp, value)
+    if row is None:
+        dedup.record_db_duplicate()
+        return False
+
+    dedup.remember(sensor_id, row.timestamp)
+    _schedule_broadcast([(sensor_id, row.timestamp, value)])
+    return True
+
+
+# Postgres admite como máximo 65535 parámetros por sentencia (3 por fila).
+_INSERT_CHUNK = 5000
+
+
+async def create_readings(batch: ReadingBatch, session: AsyncSession) -> int:
+    """Inserción en bloque de un ``ReadingBatch`` con ``ON CONFLICT DO NOTHING``.
+
+    Los duplicados dentro del lote o ya vistos se descartan antes de la BD.
+    Devuelve cuántas lecturas se insertaron realmente.
+    """
+    dedup = get_deduplicator()
+    rows: List[dict] = []
+    batch_keys: set[tuple[int, int]] = set()
+    for sensor_id, ts_ns, value in zip(batch.sensor_ids, batch.ts_ns, batch.values):
+        key = (sensor_id, ts_ns)
+        if key in batch_keys:
+            dedup.stats.duplicates_memory += 1
+            continue
+        ts = from_epoch_ns(ts_ns)
+        if dedup.is_duplicate(sensor_id, ts):
+            continue
+        batch_keys.add(key)
+        rows.append({"sensor_id": sensor_id, "timestamp": ts, "value": value})
+    if not rows:
+        return 0
+
+    inserted = []
+    async with _write_lock:
+        for start in range(0, len(rows), _INSERT_CHUNK):
+            result = await session.execute(
+                _insert_ignoring_duplicates(rows[start:start + _INSERT_CHUNK]).returning(
+                    SensorReadingModel.id,
+                    SensorReadingModel.sensor_id,
+                    SensorReadingModel.timestamp,
+                    SensorReadingModel.value,
+                )
+            )
+            inserted.extend(result.all())
+        await session.commit()
+        for row in sorted(inserted, key=lambda r: r.id):
+            _append_replay(row.sensor_id, row.id, row.timestamp, row.value)
+    for _ in range(len(rows) - len(inserted)):
+        dedup.record_db_duplicate()
+    for row in inserted:
+        dedup.remember(row.sensor_id, row.timestamp)
+    _schedule_broadcast([(row.sensor_id, row.timestamp, row.value) for row in inserted])
+    return len(inserted)
+
+
+def _insert_ignoring_duplicates(values):
+    return pg_insert(SensorReadingModel).values(values).on_conflict_do_nothing(
+        index_elements=[SensorReadingModel.sensor_id, SensorReadingModel.timestamp]
+    )
+
+
+def _append_replay(sensor_id: int, reading_id: int, timestamp: datetime, value: float) -> None:
+    # Se llama con _write_lock tomado, en el mismo orden que los commits.
+    try:
+        get_replay_log().append(sensor_id, reading_id, _event_payload(reading_id, sensor_id, timestamp, value))
+    except Exception:
+        pass
+
 
-    # Push reading to websocket subscribers; swallow errors to not block ingestion path.
+# Envíos WebSocket pendientes; cada tarea espera a la anterior para conservar el orden.
+_broadcasts: Set[asyncio.Task] = set()
+_last_broadcast: Optional[asyncio.Task] = None
+
+
+def _schedule_broadcast(readings: List[Tuple[int, datetime, float]]) -> None:
+    """Difunde las lecturas en segundo plano: el commit (y el PUBACK) no espera a los sockets."""
+    global _last_broadcast
+    if not readings:
+        return
+    task = asyncio.create_task(_broadcast_all(readings, _last_broadcast))
+    _last_broadcast = task
+    _broadcasts.add(task)
+    task.add_done_callback(_broadcasts.discard)
+
+
+async def _broadcast_all(readings: List[Tuple[int, datetime, float]], previous: Optional[asyncio.Task]) -> None:
+    if previous is not None and not previous.done():
+        await asyncio.wait({previous})
+    for sensor_id, timestamp, value in readings:
+        await _broadcast_live(sensor_id, timestamp, value)
+
+
+async def _broadcast_live(sensor_id: int, timestamp: datetime, value: float) -> None:
+    # Push reading to live subscribers; swallow errors to not block ingestion path.
     try:
-        await get_sensor_ws_manager().broadcast_reading(
+        ws_manager = get_sensor_ws_manager()
+        name = location = None
+        if ws_manager.needs_metadata:
+            sensor = get_sensor_registry().get(sensor_id)
+            if sensor is not None:
+                name, location = sensor.name, sensor.location
+        await ws_manager.broadcast_reading(
             sensor_id=sensor_id,
             payload={
                 "sensor_id": sensor_id,
-                "timestamp": reading.timestamp.isoformat(),
-                "value": reading.value,
+                "timestamp": timestamp.isoformat(),
+                "value": value,
             },
+            name=name,
+            location=location,
         )
     except Exception:
         pass
 
 
+def _event_payload(reading_id: int, sensor_id: int, timestamp: datetime, value: float) -> dict:
+    return {
+        "id": reading_id,
+        "sensor_id": sensor_id,
+        "timestamp": timestamp.isoformat(),
+        "value": value,
+    }
+
+
+async def readings_after(
+    after_id: int,
+    session: AsyncSession,
+    *,
+    sensor_ids: Optional[List[int]] = None,
+) -> List[dict]:
+    """Lecturas con id > ``after_id`` desde el replay log o, si no cubre el hueco, desde la BD."""
+    events = get_replay_log().since(after_id, sensor_ids)
+    if events is not None:
+        return events
+    stmt = select(SensorReadingModel).where(SensorReadingModel.id > after_id)
+    if sensor_ids is not None:
+        stmt = stmt.where(SensorReadingModel.sensor_id.in_(sensor_ids))
+    stmt = stmt.order_by(SensorReadingModel.id).limit(settings.SSE_REPLAY_DB_LIMIT)
+    result = await session.execute(stmt)
+    return [_event_payload(r.id, r.sensor_id, r.timestamp, r.value) for r in result.scalars().all()]
+
+
+async def iter_reading_batches(
+    sensor_id: int,
+    session: AsyncSession,
+    *,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    chunk_size: int = 10000,
+) -> AsyncIterator[ReadingBatch]:
+    """Recorre las lecturas de un sensor en orden cronológico como ``ReadingBatch`` de ``chunk_size`` filas."""
+    stmt = select(
+        SensorReadingModel.sensor_id, SensorReadingModel.timestamp, SensorReadingModel.value
+    ).where(SensorReadingModel.sensor_id == sensor_id)
+    if since is not None:
+        stmt = stmt.where(SensorReadingModel.timestamp >= since)
+    if until is not None:
+        stmt = stmt.where(SensorReadingModel.timestamp < until)
+    stmt = stmt.order_by(SensorReadingModel.timestamp)
+    result = await session.stream(stmt.execution_options(yield_per=chunk_size))
+    async for rows in result.partitions(chunk_size):
+        yield ReadingBatch.from_rows(rows)
+
+
 async def create_reading_from_topic(topic: str, payload: str, session: AsyncSession) -> None:
     """Parsea topic/payload y crea lectura si coincide con el patrón sensors/<id>."""
     if not topic.startswith("sensors/"):
@@ -109,12 +294,23 @@ async def list_readings(
 
 # Final override: support DHT11_temperature/DHT11_humidity style names
 async def create_reading_from_topic(topic: str, payload: str, session: AsyncSession) -> None:  # type: ignore[override]
+    resolved = await resolve_reading_from_topic(topic, payload, session)
+    if resolved is None:
+        return
+    sensor_id, value, ts = resolved
+    await create_reading(sensor_id=sensor_id, value=value, session=session, ts=ts)
+
+
+async def resolve_reading_from_topic(
+    topic: str, payload: str, session: AsyncSession
+) -> Optional[Tuple[int, float, Optional[datetime]]]:
+    """Parsea topic/payload y resuelve el sensor; devuelve ``(sensor_id, value, ts)`` o ``None``."""
     import logging as _logging
     import json as _json
 
     logger = _logging.getLogger("sensors.service")
     if not topic.startswith("sensors/"):
-        return
+        return None
 
     # Identificador exacto desde el tÃ³pico (puede incluir sufijos)
     _, _, id_part = topic.partition("/")
@@ -138,7 +334,7 @@ async def create_reading_from_topic(topic: str, payload: str, session: AsyncSess
         try:
             data = _json.loads(payload)
         except Exception:
-            return
+            return None
         try:
             if "value" in data:
                 value = float(data["value"])  # puede lanzar
@@ -152,10 +348,14 @@ async def create_reading_from_topic(topic: str, payload: str, session: AsyncSess
             if raw_ts is not None:
                 ts = _parse_any_timestamp(raw_ts)
         except Exception:
-            return
+            return None
 
     if value is None:
-        return
+        return None
+    if ts is not None and not fits_epoch_ns(ts):
+        # Fuera del rango de ReadingBatch: se descarta (y se confirma) en lugar de reintentarse sin fin.
+        logger.warning("Ignoring reading with out-of-range timestamp %s topic=%s", ts.isoformat(), topic)
+        return None
 
     # Construir candidatos en orden de prioridad
     candidates: list[str] = []
@@ -188,18 +388,24 @@ async def create_reading_from_topic(topic: str, payload: str, session: AsyncSess
 
     sensor_id: Optional[int] = None
     logger.debug("MQTT ingest candidates=%s topic=%s", ordered, topic)
+    registry = get_sensor_registry()
+    await registry.ensure_loaded(session)
     for cand in ordered:
-        sid = await _resolve_sensor_id2(cand, session)
+        sid = registry.resolve(cand)
         if sid is not None:
             sensor_id = sid
-            logger.info("MQTT ingest matched sensor '%s' -> id=%s", cand, sid)
+            logger.debug("MQTT ingest matched sensor '%s' -> id=%s", cand, sid)
             break
 
     if sensor_id is None:
-        logger.info("Ignoring reading for unknown sensor candidates=%s", ordered)
-        return
+        # Alta automática con el candidato más específico que cumpla el patrón.
+        new_name = next((c for c in ordered if registry.can_provision(c)), None)
+        if new_name is None:
+            logger.info("Ignoring reading for unknown sensor candidates=%s", ordered)
+            return None
+        sensor_id = await registry.provision(new_name)
 
-    await create_reading(sensor_id=sensor_id, value=value, session=session, ts=ts)
+    return sensor_id, value, ts
 
 
 
@@ -233,34 +439,6 @@ def _parse_any_timestamp(raw: object) -> Optional[datetime]:
     return None
 
 
-async def _resolve_sensor_id2(identifier: Optional[str], session: AsyncSession) -> Optional[int]:
-    """Versión robusta: resuelve por id, nombre exacto o nombre case-insensitive."""
-    if not identifier:
-        return None
-    try:
-        sensor_id = int(identifier)
-        result = await session.execute(select(SensorModel.id).where(SensorModel.id == sensor_id))
-        row = result.first()
-        if row is not None:
-            return sensor_id
-    except ValueError:
-        pass
-    # exacto
-    result = await session.execute(select(SensorModel).where(SensorModel.name == identifier))
-    sensor = result.scalar_one_or_none()
-    if sensor is not None:
-        return sensor.id
-    # case-insensitive
-    try:
-        lowered = identifier.lower()
-        result = await session.execute(select(SensorModel).where(func.lower(SensorModel.name) == lowered))
-        sensor = result.scalar_one_or_none()
-        if sensor is not None:
-            return sensor.id
-    except Exception:
-        pass
-    return None
-
 async def _resolve_sensor_id(identifier: Optional[str], session: AsyncSession) -> Optional[int]:
     """Devuelve el id de sensor si existe, resolviendo por id numÃ©rico o por nombre exacto."""
     if not identifier:
@@ -2,58 +2,291 @@ from __future__ import annotations
 
 import asyncio
 import logging
-from typing import Dict, Set
+from dataclasses import dataclass, field
+from fnmatch import fnmatchcase
+from typing import Dict, Iterable, List, Literal, Set
 
 from fastapi import WebSocket
 
 logger = logging.getLogger("sensors.websocket")
 
 
+def sensor_metric(name: str | None) -> str | None:
+    """Métrica de un sensor a partir del sufijo del nombre (``DHT11_temperature`` -> ``temperature``)."""
+    if not name or "_" not in name:
+        return None
+    return name.partition("_")[2].strip().lower() or None
+
+
+@dataclass
+class Subscription:
+    """Filtros de un socket: ids de sensor, prefijos de ubicación y comodines de métrica."""
+
+    all: bool = False
+    sensor_ids: Set[int] = field(default_factory=set)
+    locations: Set[str] = field(default_factory=set)
+    metrics: Set[str] = field(default_factory=set)
+
+    def to_dict(self) -> dict:
+        return {
+            "all": self.all,
+            "sensor_ids": sorted(self.sensor_ids),
+            "locations": sorted(self.locations),
+            "metrics": sorted(self.metrics),
+        }
+
+
+Aggregation = Literal["last", "avg", "minmax"]
+
+
+class _Bucket:
+    __slots__ = ("count", "total", "min", "max", "last")
+
+    def __init__(self, value: float, payload: dict) -> None:
+        self.count = 1
+        self.total = value
+        self.min = value
+        self.max = value
+        self.last = payload
+
+
+class CoalescedStream:
+    """Agrupa lecturas por sensor para un socket y las emite una vez por tick.
+
+    ``agg`` decide qué se envía por sensor: ``last`` (última lectura), ``avg``
+    (media del intervalo) o ``minmax`` (mínimo, máximo y última).
+    """
+
+    def __init__(self, max_hz: float, agg: Aggregation = "last") -> None:
+        self.interval = 1.0 / max_hz
+        self.agg = agg
+        self._buckets: Dict[int, _Bucket] = {}
+        self.task: asyncio.Task | None = None
+
+    def add(self, sensor_id: int, payload: dict) -> None:
+        value = float(payload["value"])
+        bucket = self._buckets.get(sensor_id)
+        if bucket is None:
+            self._buckets[sensor_id] = _Bucket(value, payload)
+            return
+        bucket.count += 1
+        bucket.total += value
+        bucket.min = min(bucket.min, value)
+        bucket.max = max(bucket.max, value)
+        bucket.last = payload
+
+    def drain(self) -> List[dict]:
+        buckets, self._buckets = self._buckets, {}
+        if self.agg == "last":
+            return [b.last for b in buckets.values()]
+        frames: List[dict] = []
+        for b in buckets.values():
+            frame = {"sensor_id": b.last["sensor_id"], "timestamp": b.last["timestamp"], "count": b.count}
+            if self.agg == "avg":
+                frame["value"] = b.total / b.count
+            else:
+                frame.update(min=b.min, max=b.max, value=b.last["value"])
+            frames.append(frame)
+        return frames
+
+
 class SensorWebSocketManager:
-    """Manage WebSocket subscribers for sensor readings."""
+    """Manage WebSocket subscribers for sensor readings.
+
+    Todos los índices son ``set`` mutados en sitio: ninguna mutación hace
+    ``await`` y ``broadcast_reading`` construye ``targets`` antes del primer
+    envío, así que no hace falta copiarlos. ``_subs`` es el índice inverso
+    socket -> suscripción, por lo que desconectar cuesta O(k) en las
+    suscripciones del socket.
+
+    Los filtros también están indexados: prefijos de ubicación por prefijo
+    (se prueban solo las longitudes de prefijo en uso) y métricas exactas por
+    nombre; ``fnmatchcase`` solo se evalúa sobre los patrones distintos con
+    comodines, no por socket.
+
+    Los sockets con ``max_hz`` reciben un único frame por tick con las
+    lecturas agregadas (ver ``CoalescedStream``) en lugar de un mensaje por
+    lectura.
+    """
 
     def __init__(self) -> None:
         self._all: Set[WebSocket] = set()
         self._by_sensor: Dict[int, Set[WebSocket]] = {}
-        self._lock = asyncio.Lock()
+        self._by_location: Dict[str, Set[WebSocket]] = {}
+        self._location_lengths: Dict[int, int] = {}
+        self._by_metric: Dict[str, Set[WebSocket]] = {}
+        self._by_pattern: Dict[str, Set[WebSocket]] = {}
+        self._subs: Dict[WebSocket, Subscription] = {}
+        self._streams: Dict[WebSocket, CoalescedStream] = {}
 
-    async def connect(self, websocket: WebSocket, sensor_id: int | None) -> None:
-        async with self._lock:
-            if sensor_id is None:
-                self._all.add(websocket)
-            else:
-                self._by_sensor.setdefault(sensor_id, set()).add(websocket)
+    @property
+    def needs_metadata(self) -> bool:
+        """Hay suscriptores por ubicación/métrica que requieren nombre y ubicación del sensor."""
+        return bool(self._by_location or self._by_metric or self._by_pattern)
+
+    async def connect(
+        self,
+        websocket: WebSocket,
+        sensor_id: int | None,
+        *,
+        max_hz: float | None = None,
+        agg: Aggregation = "last",
+    ) -> None:
+        if sensor_id is None:
+            self.subscribe(websocket, all=True)
+        else:
+            self.subscribe(websocket, sensor_ids=[sensor_id])
+        if max_hz:
+            stream = CoalescedStream(max_hz, agg)
+            stream.task = asyncio.create_task(self._flush_loop(websocket, stream))
+            self._streams[websocket] = stream
+
+    async def disconnect(self, websocket: WebSocket, sensor_id: int | None = None) -> None:
+        self._remove(websocket)
+
+    def subscribe(
+        self,
+        websocket: WebSocket,
+        *,
+        all: bool = False,
+        sensor_ids: Iterable[int] = (),
+        locations: Iterable[str] = (),
+        metrics: Iterable[str] = (),
+    ) -> Subscription:
+        sub = self._subs.setdefault(websocket, Subscription())
+        if all and not sub.all:
+            sub.all = True
+            self._all.add(websocket)
+        for sid in set(sensor_ids) - sub.sensor_ids:
+            sub.sensor_ids.add(sid)
+            self._by_sensor.setdefault(sid, set()).add(websocket)
+        for prefix in set(locations) - sub.locations:
+            sub.locations.add(prefix)
+            self._add_location(prefix, websocket)
+        for metric in {m.lower() for m in metrics} - sub.metrics:
+            sub.metrics.add(metric)
+            self._metric_index(metric).setdefault(metric, set()).add(websocket)
+        return sub
 
-    async def disconnect(self, websocket: WebSocket, sensor_id: int | None) -> None:
-        async with self._lock:
+    def unsubscribe(
+        self,
+        websocket: WebSocket,
+        *,
+        all: bool = False,
+        sensor_ids: Iterable[int] = (),
+        locations: Iterable[str] = (),
+        metrics: Iterable[str] = (),
+    ) -> Subscription:
+        sub = self._subs.get(websocket)
+        if sub is None:
+            return Subscription()
+        if all and sub.all:
+            sub.all = False
             self._all.discard(websocket)
-            for bucket in self._by_sensor.values():
-                bucket.discard(websocket)
-            # clean empty buckets
-            self._by_sensor = {k: v for k, v in self._by_sensor.items() if v}
-
-    async def broadcast_reading(self, sensor_id: int, payload: dict) -> None:
-        """Send a reading to sensor-specific and global subscribers."""
-        targets: Set[WebSocket] = set()
-        async with self._lock:
-            targets.update(self._all)
-            targets.update(self._by_sensor.get(sensor_id, set()))
-
-        stale: Set[WebSocket] = set()
+        for sid in set(sensor_ids) & sub.sensor_ids:
+            sub.sensor_ids.discard(sid)
+            _discard(self._by_sensor, sid, websocket)
+        for prefix in set(locations) & sub.locations:
+            sub.locations.discard(prefix)
+            self._discard_location(prefix, websocket)
+        for metric in {m.lower() for m in metrics} & sub.metrics:
+            sub.metrics.discard(metric)
+            _discard(self._metric_index(metric), metric, websocket)
+        return sub
+
+    async def broadcast_reading(
+        self,
+        sensor_id: int,
+        payload: dict,
+        *,
+        name: str | None = None,
+        location: str | None = None,
+    ) -> None:
+        """Send a reading to sensor-specific, pattern and global subscribers."""
+        targets: Set[WebSocket] = set(self._all)
+        targets.update(self._by_sensor.get(sensor_id, ()))
+        if location:
+            for length in self._location_lengths:
+                if length <= len(location):
+                    targets.update(self._by_location.get(location[:length], ()))
+        metric = sensor_metric(name)
+        if metric:
+            targets.update(self._by_metric.get(metric, ()))
+            for pattern, sockets in self._by_pattern.items():
+                if fnmatchcase(metric, pattern):
+                    targets.update(sockets)
+
         for ws in targets:
+            stream = self._streams.get(ws)
+            if stream is not None:
+                stream.add(sensor_id, payload)
+                continue
             try:
                 await ws.send_json(payload)
             except Exception as exc:  # noqa: BLE001
                 logger.debug("Failed to send ws message: %s", exc)
-                stale.add(ws)
-
-        if stale:
-            async with self._lock:
-                for ws in stale:
-                    self._all.discard(ws)
-                for bucket in self._by_sensor.values():
-                    bucket.difference_update(stale)
-                self._by_sensor = {k: v for k, v in self._by_sensor.items() if v}
+                self._remove(ws)
+
+    async def _flush_loop(self, websocket: WebSocket, stream: CoalescedStream) -> None:
+        while True:
+            await asyncio.sleep(stream.interval)
+            readings = stream.drain()
+            if not readings:
+                continue
+            try:
+                await websocket.send_json({"type": "readings", "agg": stream.agg, "readings": readings})
+            except Exception as exc:  # noqa: BLE001
+                logger.debug("Failed to send ws message: %s", exc)
+                self._remove(websocket)
+                return
+
+    def _remove(self, websocket: WebSocket) -> None:
+        stream = self._streams.pop(websocket, None)
+        if stream is not None and stream.task is not None and stream.task is not asyncio.current_task():
+            stream.task.cancel()
+        sub = self._subs.pop(websocket, None)
+        if sub is None:
+            return
+        if sub.all:
+            self._all.discard(websocket)
+        for sid in sub.sensor_ids:
+            _discard(self._by_sensor, sid, websocket)
+        for prefix in sub.locations:
+            self._discard_location(prefix, websocket)
+        for metric in sub.metrics:
+            _discard(self._metric_index(metric), metric, websocket)
+
+    def _metric_index(self, metric: str) -> Dict[str, Set[WebSocket]]:
+        return self._by_pattern if _is_pattern(metric) else self._by_metric
+
+    def _add_location(self, prefix: str, websocket: WebSocket) -> None:
+        bucket = self._by_location.get(prefix)
+        if bucket is None:
+            bucket = self._by_location[prefix] = set()
+            self._location_lengths[len(prefix)] = self._location_lengths.get(len(prefix), 0) + 1
+        bucket.add(websocket)
+
+    def _discard_location(self, prefix: str, websocket: WebSocket) -> None:
+        if _discard(self._by_location, prefix, websocket):
+            remaining = self._location_lengths.pop(len(prefix)) - 1
+            if remaining:
+                self._location_lengths[len(prefix)] = remaining
+
+
+def _discard(index: Dict, key, websocket: WebSocket) -> bool:
+    """Quita ``websocket`` del bucket ``key``; devuelve True si el bucket quedó vacío y se eliminó."""
+    bucket = index.get(key)
+    if bucket is None:
+        return False
+    bucket.discard(websocket)
+    if bucket:
+        return False
+    del index[key]
+    return True
+
+
+def _is_pattern(metric: str) -> bool:
+    return any(char in metric for char in "*?[")
 
 
 _manager: SensorWebSocketManager | None = None
@@ -17,3 +17,28 @@ def test_root_ok():
     assert res.status_code == 200
     body = res.json()
     assert "app" in body and "message" in body
+
+
+def test_ready_not_ready_before_database_init():
+    res = client.get("/ready")
+    assert res.status_code == 503
+    body = res.json()
+    assert body["status"] == "not ready" and body["database"] == "pending"
+
+
+def test_ready_times_out_on_unreachable_database(monkeypatch):
+    import asyncio
+
+    from app import main
+    from app.core.config import settings
+
+    async def hanging_ping():
+        await asyncio.sleep(10)  # connect() colgado contra un host inalcanzable
+
+    monkeypatch.setattr(settings, "READY_DB_TIMEOUT", 0.05)
+    monkeypatch.setattr(main, "_ping_database", hanging_ping)
+    monkeypatch.setitem(main._startup, "database", "ready")
+
+    res = client.get("/ready")
+    assert res.status_code == 503
+    assert res.json()["database"] == "unreachable: TimeoutError"
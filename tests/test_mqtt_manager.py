@@ -0,0 +1,302 @@
+import asyncio
+
+import pytest
+
+from app.modules.mqtt.manager import MQTTManager, PublishBufferFull
+
+
+def test_handle_message_acks_after_handler():
+    received = []
+
+    async def handler(topic: str, payload: str) -> None:
+        received.append((topic, payload))
+
+    async def run():
+        manager = MQTTManager()
+        manager.register_message_handler(handler)
+        return await manager._handle_message(None, "sensors/1", b"42.5", 1, {})
+
+    assert asyncio.run(run()) == 0
+    assert received == [("sensors/1", "42.5")]
+
+
+def test_handle_message_failure_is_not_acked():
+    async def handler(topic: str, payload: str) -> None:
+        raise RuntimeError("db down")
+
+    async def run():
+        manager = MQTTManager()
+        manager.register_message_handler(handler)
+        await manager._handle_message(_FakeClient(), "sensors/1", b"1", 1, {})
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(run())
+
+
+def test_handle_message_limits_inflight(monkeypatch):
+    from app.core.config import settings
+
+    monkeypatch.setattr(settings, "MQTT_MAX_INFLIGHT", 2)
+    active = 0
+    peak = 0
+
+    async def handler(topic: str, payload: str) -> None:
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+
+    async def run():
+        manager = MQTTManager()
+        manager.register_message_handler(handler)
+        await asyncio.gather(*(manager._handle_message(None, "sensors/1", b"1", 1, {}) for _ in range(6)))
+
+    asyncio.run(run())
+    assert peak == 2
+
+
+def test_backoff_delay_is_bounded():
+    from app.modules.mqtt.manager import backoff_delay
+
+    for attempt in range(10):
+        delay = backoff_delay(attempt, base=0.5, cap=30.0)
+        assert 0.5 <= delay <= min(30.0, 0.5 * 2**attempt)
+
+
+class _FakeClient:
+    _optimistic_acknowledgement = False
+
+    def __init__(self):
+        self.published = []
+        self.subscribed = []
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        self.published.append((topic, payload))
+
+    def subscribe(self, topic, qos):
+        self.subscribed.append((topic, qos))
+
+
+def test_publish_buffers_while_disconnected_and_flushes(monkeypatch):
+    from app.core.config import settings
+
+    monkeypatch.setattr(settings, "MQTT_PUBLISH_BUFFER_SIZE", 2)
+
+    async def run():
+        manager = MQTTManager()
+        await manager.subscribe("sensors/#", qos=1)
+        for i in range(2):
+            assert await manager.publish("cmd/1", str(i)) is False
+        with pytest.raises(PublishBufferFull):
+            await manager.publish("cmd/1", "2")
+        stats = manager.stats()
+        assert stats["buffered_publishes"] == 2
+        assert stats["dropped_publishes"] == 1
+
+        fake = _FakeClient()
+        manager._client = fake
+        manager._handle_connect(fake, None, 0, None)
+        manager._resubscribe()
+        manager._flush_pending()
+        return fake, manager.stats()
+
+    fake, stats = asyncio.run(run())
+    assert fake.subscribed == [("sensors/#", 1)]
+    assert fake.published == [("cmd/1", "0"), ("cmd/1", "1")]
+    assert stats["state"] == "connected" and stats["buffered_publishes"] == 0
+
+
+def test_topic_aliases_reuse_and_capacity():
+    from app.modules.mqtt.manager import TopicAliases
+
+    aliases = TopicAliases(maximum=1)
+    assert aliases.resolve("devices/1/config") == ("devices/1/config", 1)
+    assert aliases.resolve("devices/1/config") == ("", 1)
+    assert aliases.resolve("devices/2/config") == ("devices/2/config", None)
+
+
+def test_publish_many_reports_per_message_results():
+    class _Failing(_FakeClient):
+        protocol_version = 4
+
+        def publish(self, topic, payload, qos=0, retain=False):
+            if topic == "bad":
+                raise ValueError("invalid topic")
+            super().publish(topic, payload, qos, retain)
+
+    async def run():
+        manager = MQTTManager()
+        manager._client = _Failing()
+        manager._connected.set()
+        return await manager.publish_many([("a", "1", 0, False), ("bad", "2", 0, False), ("b", "3", 1, False)])
+
+    results = asyncio.run(run())
+    assert results[0] is True and results[2] is True
+    assert isinstance(results[1], ValueError)
+
+
+def test_supervisor_backs_off_after_flapping_connections(monkeypatch):
+    from app.modules.mqtt import manager as manager_module
+
+    attempts = []
+
+    def fake_backoff(attempt, base, cap):
+        attempts.append(attempt)
+        return 0
+
+    monkeypatch.setattr(manager_module, "backoff_delay", fake_backoff)
+
+    async def run():
+        manager = MQTTManager()
+
+        async def connect_once():
+            fake = _FakeClient()
+            manager._client = fake
+            manager._lost.clear()
+            manager._handle_connect(fake, None, 0, None)
+            # El broker corta la conexión en cuanto se establece.
+            asyncio.get_running_loop().call_soon(manager._lost.set)
+
+        manager._connect_once = connect_once
+        await manager.start()
+        while len(attempts) < 3:
+            await asyncio.sleep(0)
+        await manager.disconnect()
+
+    asyncio.run(run())
+    assert attempts[:3] == [0, 1, 2]
+
+
+def test_handler_failure_forces_reconnect_for_redelivery():
+    async def handler(topic: str, payload: str) -> None:
+        raise RuntimeError("db down")
+
+    async def run():
+        manager = MQTTManager()
+        manager.register_message_handler(handler)
+        fake = _FakeClient()
+        manager._client = fake
+        manager._handle_connect(fake, None, 0, None)
+        with pytest.raises(RuntimeError):
+            await manager._handle_message(fake, "sensors/1", b"1", 1, {})
+        return manager
+
+    manager = asyncio.run(run())
+    assert manager._lost.is_set() and not manager.is_connected
+    assert manager.stats()["disconnects"] == 1
+
+
+def test_publish_many_reports_dropped_when_buffer_is_full(monkeypatch):
+    from app.core.config import settings
+
+    monkeypatch.setattr(settings, "MQTT_PUBLISH_BUFFER_SIZE", 3)
+
+    async def run():
+        manager = MQTTManager()
+        return await manager.publish_many([(f"cmd/{i}", "x", 1, False) for i in range(5)]), manager.stats()
+
+    results, stats = asyncio.run(run())
+    assert results[:3] == [False, False, False]
+    assert all(isinstance(r, PublishBufferFull) for r in results[3:])
+    assert stats["buffered_publishes"] == 3 and stats["dropped_publishes"] == 2
+
+
+def test_qos0_failure_does_not_force_reconnect():
+    async def handler(topic: str, payload: str) -> None:
+        raise RuntimeError("db down")
+
+    async def run():
+        manager = MQTTManager()
+        manager.register_message_handler(handler)
+        fake = _FakeClient()
+        manager._client = fake
+        manager._handle_connect(fake, None, 0, None)
+        assert await manager._handle_message(fake, "sensors/1", b"1", 0, {}) == 0
+        return manager
+
+    manager = asyncio.run(run())
+    assert manager.is_connected and not manager._lost.is_set()
+
+
+def test_poison_message_is_acked_with_error_after_max_redeliveries(monkeypatch):
+    from app.core.config import settings
+
+    monkeypatch.setattr(settings, "MQTT_MAX_REDELIVERIES", 2)
+
+    async def handler(topic: str, payload: str) -> None:
+        raise ValueError("value too long")
+
+    async def run():
+        manager = MQTTManager()
+        manager.register_message_handler(handler)
+        fake = _FakeClient()
+        outcomes = []
+        for dup in (0, 1):
+            with pytest.raises(ValueError):
+                await manager._handle_message(fake, "sensors/x", b"1", 1, {"dup": dup})
+            outcomes.append("redeliver")
+        outcomes.append(await manager._handle_message(fake, "sensors/x", b"1", 1, {"dup": 1}))
+        return outcomes, manager._delivery_failures
+
+    outcomes, failures = asyncio.run(run())
+    # Entrega original + 2 reentregas; la última se confirma con error.
+    assert outcomes == ["redeliver", "redeliver", 0x80]
+    assert failures == {}
+
+
+def test_supervisor_falls_back_to_mqtt_311(monkeypatch):
+    from app.modules.mqtt import manager as manager_module
+
+    versions = []
+
+    class _DowngradingClient(_FakeClient):
+        """Broker solo 3.1.1: gmqtt pide bajar de versión en lugar de llamar a on_connect."""
+
+        downgrade_requested = False
+
+        def __init__(self, client_id, **kwargs):
+            super().__init__()
+
+        async def connect(self, host, port, version):
+            versions.append(version)
+            if version == manager_module.MQTT_V50:
+                self.downgrade_requested = True
+            else:
+                self.on_connect(self, 0, 0, {})
+
+        async def disconnect(self):
+            pass
+
+    monkeypatch.setattr(manager_module, "_client_class", lambda: _DowngradingClient)
+    monkeypatch.setattr(manager_module, "backoff_delay", lambda attempt, base, cap: 0)
+
+    async def run():
+        manager = MQTTManager()
+        await asyncio.wait_for(manager.connect(), timeout=1)
+        await manager.disconnect()
+
+    asyncio.run(run())
+    assert versions == [manager_module.MQTT_V50, manager_module.MQTT_V311]
+
+
+def test_aliased_publish_passes_qos_to_gmqtt():
+    from app.modules.mqtt.manager import TopicAliases
+
+    calls = []
+
+    class _V5Client(_FakeClient):
+        protocol_version = 5
+
+        def publish(self, message_or_topic, payload=None, qos=0, retain=False):
+            calls.append((message_or_topic.topic, message_or_topic.qos, qos))
+
+    async def run():
+        manager = MQTTManager()
+        manager._client = _V5Client()
+        manager._connected.set()
+        manager._aliases = TopicAliases(maximum=10)
+        await manager.publish_many([("devices/1/config", "a", 1, False), ("devices/1/config", "b", 1, False)])
+
+    asyncio.run(run())
+    assert calls == [(b"devices/1/config", 1, 1), (b"", 1, 1)]
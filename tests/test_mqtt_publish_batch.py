@@ -0,0 +1,102 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+
+from app.db.session import get_session
+from app.main import app
+from app.modules.mqtt import service
+from app.modules.mqtt.manager import MQTTManager
+from app.modules.sensors.schemas import Sensor
+
+
+SENSORS = [
+    Sensor(id=1, name="DHT11_temperature", location="plant-a/line-1"),
+    Sensor(id=2, name="DHT11_humidity", location="plant-a/line-2"),
+    Sensor(id=3, name="BMP280_pressure", location="plant-b"),
+]
+
+
+def _setup(monkeypatch):
+    async def list_sensors(session):
+        return SENSORS
+
+    async def no_session():
+        yield None
+
+    manager = MQTTManager()
+    monkeypatch.setattr(service, "list_sensors", list_sensors)
+    monkeypatch.setattr(service, "get_mqtt_manager", lambda: manager)
+    app.dependency_overrides[get_session] = no_session
+    return manager
+
+
+def _teardown():
+    app.dependency_overrides.pop(get_session, None)
+
+
+def test_template_escapes_braces_and_filters_by_location(monkeypatch):
+    manager = _setup(monkeypatch)
+    try:
+        res = TestClient(app).post(
+            "/api/mqtt/publish/batch",
+            json={
+                "template": {
+                    "topic": "devices/{sensor_id}/config",
+                    "payload": '{{"name": "{name}", "interval": 10}}',
+                    "location_prefix": "plant-a/",
+                }
+            },
+        )
+    finally:
+        _teardown()
+
+    assert res.status_code == 202
+    body = res.json()
+    assert body["queued"] == 2 and body["sent"] == 0
+    assert [r["topic"] for r in body["results"]] == ["devices/1/config", "devices/2/config"]
+    assert manager._pending[0][1] == '{"name": "DHT11_temperature", "interval": 10}'
+
+
+def test_template_filters_by_sensor_ids(monkeypatch):
+    from app.modules.mqtt.schemas import PublishTemplate
+
+    _setup(monkeypatch)
+    _teardown()
+    template = PublishTemplate(topic="devices/{sensor_id}", payload="{location}", sensor_ids=[3, 1])
+    expanded = asyncio.run(service._expand_template(template, None))
+
+    assert [(topic, payload) for topic, payload, *_ in expanded] == [
+        ("devices/1", "plant-a/line-1"),
+        ("devices/3", "plant-b"),
+    ]
+
+
+def test_unknown_placeholder_is_rejected(monkeypatch):
+    _setup(monkeypatch)
+    try:
+        res = TestClient(app).post(
+            "/api/mqtt/publish/batch",
+            json={"template": {"topic": "devices/{serial}", "payload": "x"}},
+        )
+    finally:
+        _teardown()
+
+    assert res.status_code == 422
+    assert "serial" in res.json()["detail"]
+
+
+def test_batch_over_maximum_is_rejected(monkeypatch):
+    from app.core.config import settings
+
+    manager = _setup(monkeypatch)
+    monkeypatch.setattr(settings, "MQTT_PUBLISH_BATCH_MAX", 2)
+    try:
+        res = TestClient(app).post(
+            "/api/mqtt/publish/batch",
+            json={"messages": [{"topic": f"cmd/{i}", "payload": "x"} for i in range(3)]},
+        )
+    finally:
+        _teardown()
+
+    assert res.status_code == 422
+    assert len(manager._pending) == 0
@@ -0,0 +1,176 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.modules.sensors.batch import ReadingBatch
+from app.modules.sensors.ingest_queue import IngestQueue
+
+
+T0 = datetime(2024, 1, 1, 12, 0, 0, 123456, tzinfo=timezone.utc)
+
+
+def test_batch_columns_and_row_views():
+    batch = ReadingBatch.from_rows([(1, T0, 20.5), (2, T0 + timedelta(seconds=1), 21.0)])
+
+    assert len(batch) == 2
+    assert batch.nbytes == 2 * 24
+    row = batch[-1]
+    assert (row.sensor_id, row.timestamp, row.value) == (2, T0 + timedelta(seconds=1), 21.0)
+    assert [r.sensor_id for r in batch] == [1, 2]
+    with pytest.raises(IndexError):
+        batch[2]
+
+
+def test_naive_timestamps_are_treated_as_utc():
+    batch = ReadingBatch()
+    batch.append(1, T0.replace(tzinfo=None), 1.0)
+    assert batch[0].timestamp == T0
+
+
+def test_ingest_queue_writes_one_batch_and_releases_waiters():
+    written = []
+
+    async def writer(batch):
+        written.append(len(batch))
+        return len(batch)
+
+    async def run():
+        queue = IngestQueue(max_batch=3, max_delay=10, writer=writer)
+        await asyncio.gather(*(queue.submit(1, float(i), T0 + timedelta(seconds=i)) for i in range(3)))
+
+    asyncio.run(run())
+    assert written == [3]
+
+
+def test_ingest_queue_propagates_write_errors():
+    async def writer(batch):
+        raise RuntimeError("db down")
+
+    async def run():
+        queue = IngestQueue(max_batch=100, max_delay=0.01, writer=writer)
+        await queue.submit(1, 1.0, T0)
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(run())
+
+
+def test_out_of_range_timestamp_keeps_columns_aligned():
+    batch = ReadingBatch()
+    with pytest.raises(OverflowError):
+        batch.append(1, datetime(3000, 1, 1, tzinfo=timezone.utc), 1.0)
+    batch.append(2, T0, 2.0)
+    assert (len(batch.sensor_ids), len(batch.ts_ns), len(batch.values)) == (1, 1, 1)
+    assert (batch[0].sensor_id, batch[0].value) == (2, 2.0)
+
+
+def test_ingest_queue_rejects_bad_reading_without_shifting_others():
+    written = []
+
+    async def writer(batch):
+        written.extend((r.sensor_id, r.value) for r in batch)
+        return len(batch)
+
+    async def run():
+        queue = IngestQueue(max_batch=100, max_delay=0.01, writer=writer)
+        return await asyncio.gather(
+            queue.submit(1, 1.0, datetime(3000, 1, 1, tzinfo=timezone.utc)),
+            queue.submit(2, 2.0, T0),
+            queue.submit(3, 3.0, T0),
+            return_exceptions=True,
+        )
+
+    results = asyncio.run(run())
+    assert isinstance(results[0], OverflowError)
+    assert written == [(2, 2.0), (3, 3.0)]
+
+
+def test_resolve_reading_drops_out_of_range_timestamp(monkeypatch):
+    from app.modules.sensors import service
+
+    class _Registry:
+        async def ensure_loaded(self, session):
+            pass
+
+        def resolve(self, identifier):
+            return 7
+
+    monkeypatch.setattr(service, "get_sensor_registry", lambda: _Registry())
+    payload = '{"value": 1.5, "timestamp": "3000-01-01T00:00:00Z"}'
+    ok = '{"value": 1.5, "timestamp": "2024-01-01T00:00:00Z"}'
+
+    assert asyncio.run(service.resolve_reading_from_topic("sensors/DHT11_temperature", payload, None)) is None
+    assert asyncio.run(service.resolve_reading_from_topic("sensors/DHT11_temperature", ok, None))[0] == 7
+
+
+def test_ingest_queue_batch_size_fits_inflight_window(monkeypatch):
+    from app.core.config import settings
+    from app.modules.sensors import ingest_queue
+
+    monkeypatch.setattr(settings, "INGEST_BATCH_SIZE", 500)
+    monkeypatch.setattr(settings, "MQTT_MAX_INFLIGHT", 100)
+    monkeypatch.setattr(ingest_queue, "_queue", None)
+
+    assert ingest_queue.get_ingest_queue().max_batch == 100
+
+
+def test_ingest_queue_isolates_rejected_rows():
+    from sqlalchemy.exc import IntegrityError
+
+    written = []
+
+    async def writer(batch):
+        if 2 in batch.sensor_ids:
+            raise IntegrityError("INSERT", {}, Exception("sensor 2 was deleted"))
+        written.extend(batch.sensor_ids)
+        return len(batch)
+
+    async def run():
+        queue = IngestQueue(max_batch=4, max_delay=10, writer=writer)
+        return await asyncio.gather(
+            *(queue.submit(sensor_id, 1.0, T0) for sensor_id in (1, 2, 3, 4)), return_exceptions=True
+        )
+
+    results = asyncio.run(run())
+    assert [isinstance(r, IntegrityError) for r in results] == [False, True, False, False]
+    assert sorted(written) == [1, 3, 4]
+
+
+def test_create_readings_returns_before_websocket_fanout(monkeypatch):
+    from types import SimpleNamespace
+
+    from app.modules.sensors import service
+    from app.modules.sensors.dedup import ReadingDeduplicator
+    from app.modules.sensors.replay_log import ReplayLog
+
+    release = None
+    sent = []
+
+    async def slow_broadcast(sensor_id, timestamp, value):
+        await release.wait()  # dashboard lento
+        sent.append(sensor_id)
+
+    monkeypatch.setattr(service, "_broadcast_live", slow_broadcast)
+    monkeypatch.setattr(service, "get_deduplicator", lambda: ReadingDeduplicator(16))
+    monkeypatch.setattr(service, "get_replay_log", lambda: ReplayLog(10, 60))
+
+    class _Session:
+        async def execute(self, stmt):
+            rows = [SimpleNamespace(id=i, sensor_id=i, timestamp=T0, value=1.0) for i in (1, 2)]
+            return SimpleNamespace(all=lambda: rows)
+
+        async def commit(self):
+            pass
+
+    async def run():
+        nonlocal release
+        release = asyncio.Event()
+        batch = ReadingBatch.from_rows([(1, T0, 1.0), (2, T0, 1.0)])
+        inserted = await asyncio.wait_for(service.create_readings(batch, _Session()), timeout=1)
+        assert sent == []
+        release.set()
+        await asyncio.gather(*service._broadcasts)
+        return inserted
+
+    assert asyncio.run(run()) == 2
+    assert sent == [1, 2]
@@ -0,0 +1,30 @@
+from datetime import datetime, timedelta, timezone
+
+from app.modules.sensors.dedup import ReadingDeduplicator
+
+
+T0 = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def test_recent_timestamps_are_dropped_after_commit():
+    dedup = ReadingDeduplicator(window=2)
+    assert not dedup.is_duplicate(1, T0)
+    dedup.remember(1, T0)
+    assert dedup.is_duplicate(1, T0)
+    assert dedup.is_duplicate(1, T0.astimezone(timezone(timedelta(hours=2))))
+    assert not dedup.is_duplicate(2, T0)
+
+    dedup.remember(1, T0 + timedelta(seconds=1))
+    dedup.remember(1, T0 + timedelta(seconds=2))
+    assert not dedup.is_duplicate(1, T0)  # fuera de la ventana
+    assert dedup.snapshot()["duplicates_memory"] == 2
+
+
+def test_out_of_order_arrivals_are_counted():
+    dedup = ReadingDeduplicator(window=8)
+    dedup.remember(1, T0 + timedelta(seconds=5))
+    dedup.remember(1, T0)
+    dedup.remember(1, T0 + timedelta(seconds=6))
+    stats = dedup.snapshot()
+    assert stats["accepted"] == 3
+    assert stats["out_of_order"] == 1
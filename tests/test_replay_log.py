@@ -0,0 +1,107 @@
+import asyncio
+
+from app.modules.sensors.replay_log import ReplayLog
+
+
+def _event(event_id: int, sensor_id: int) -> dict:
+    return {"id": event_id, "sensor_id": sensor_id, "timestamp": "t", "value": float(event_id)}
+
+
+def test_since_replays_gap_from_log():
+    log = ReplayLog(max_events=10, max_age=60)
+    for event_id, sensor_id in [(10, 1), (11, 2), (12, 1), (13, 2)]:
+        log.append(sensor_id, event_id, _event(event_id, sensor_id))
+
+    assert [e["id"] for e in log.since(10)] == [11, 12, 13]
+    assert [e["id"] for e in log.since(10, [1])] == [12]
+
+
+def test_since_requires_db_when_gap_exceeds_log():
+    log = ReplayLog(max_events=2, max_age=60)
+    assert log.since(0) is None  # nada registrado desde el arranque
+    for event_id in (5, 6, 7):
+        log.append(1, event_id, _event(event_id, 1))
+
+    assert log.since(4, [1]) is None  # el 5 fue desalojado
+    assert [e["id"] for e in log.since(5, [1])] == [6, 7]
+    assert log.since(3, [2]) is None  # anterior al arranque
+    assert log.since(4, [2]) == []
+
+
+def test_listeners_receive_matching_sensors():
+    async def run():
+        log = ReplayLog(max_events=10, max_age=60)
+        only_two = log.listen([2])
+        log.append(1, 1, _event(1, 1))
+        log.append(2, 2, _event(2, 2))
+        log.unlisten(only_two)
+        log.append(2, 3, _event(3, 2))
+        return [only_two.queue.get_nowait()["id"] for _ in range(only_two.queue.qsize())]
+
+    assert asyncio.run(run()) == [2]
+
+
+def test_concurrent_writes_publish_ids_in_order(monkeypatch):
+    from datetime import datetime, timezone
+    from types import SimpleNamespace
+
+    from app.modules.sensors import service
+
+    log = ReplayLog(max_events=10, max_age=60)
+    monkeypatch.setattr(service, "get_replay_log", lambda: log)
+    next_id = iter(range(1, 100))
+
+    class _Session:
+        """Simula commits que terminan en distinto orden al de asignación de ids."""
+
+        def __init__(self, commit_delay: float) -> None:
+            self.commit_delay = commit_delay
+
+        async def execute(self, stmt):
+            row = SimpleNamespace(id=next(next_id), timestamp=datetime.now(timezone.utc))
+            return SimpleNamespace(first=lambda: row)
+
+        async def commit(self):
+            await asyncio.sleep(self.commit_delay)
+
+    async def run():
+        listener = log.listen()
+        await asyncio.gather(
+            service.create_reading(1, 1.0, _Session(0.02)),
+            service.create_reading(2, 2.0, _Session(0.0)),
+        )
+        return [listener.queue.get_nowait()["id"] for _ in range(listener.queue.qsize())]
+
+    assert asyncio.run(run()) == [1, 2]
+
+
+def test_sse_backlog_pages_until_gap_is_closed(monkeypatch):
+    from contextlib import asynccontextmanager
+
+    from app.core.config import settings
+    from app.modules.sensors import router
+
+    monkeypatch.setattr(settings, "SSE_REPLAY_DB_LIMIT", 2)
+    stored = [_event(event_id, 1) for event_id in range(1, 6)]
+    cursors = []
+
+    async def readings_after(after_id, session, *, sensor_ids=None):
+        cursors.append(after_id)
+        return [e for e in stored if e["id"] > after_id][: settings.SSE_REPLAY_DB_LIMIT]
+
+    @asynccontextmanager
+    async def session_local():
+        yield None
+
+    monkeypatch.setattr(router, "svc_readings_after", readings_after)
+    monkeypatch.setattr(router, "SessionLocal", session_local)
+
+    async def run():
+        events = router._sse_events(None, None, 0)
+        frames = [await events.__anext__() for _ in range(6)]
+        await events.aclose()
+        return frames
+
+    frames = asyncio.run(run())
+    assert [f.split("\n", 1)[0] for f in frames[1:]] == [f"id: {i}" for i in range(1, 6)]
+    assert cursors == [0, 2, 4]
@@ -0,0 +1,96 @@
+import asyncio
+
+from sqlalchemy.dialects import postgresql
+
+from app.core.config import settings
+from app.modules.sensors import registry as registry_module
+from app.modules.sensors.model import Sensor as SensorModel
+from app.modules.sensors.registry import SensorRegistry
+from app.modules.sensors.schemas import Sensor
+
+
+def test_resolve_by_id_exact_and_case_insensitive_name():
+    registry = SensorRegistry()
+    registry._replace([Sensor(id=1, name="DHT11_temperature"), Sensor(id=2, name="Boiler")])
+
+    assert registry.resolve("1") == 1
+    assert registry.resolve("DHT11_temperature") == 1
+    assert registry.resolve("boiler") == 2
+    assert registry.resolve("3") is None
+    assert [s.id for s in registry.all()] == [1, 2]
+
+
+class _FakeSession:
+    """Simula ``INSERT ... ON CONFLICT DO NOTHING RETURNING``: ``taken`` son filas de otra réplica."""
+
+    next_id = 10
+    taken = {}
+    batches = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, stmt):
+        params = stmt.compile(dialect=postgresql.dialect()).params
+        values = [v for k, v in params.items() if k.startswith("name")]
+        names = sorted(n for v in values for n in (v if isinstance(v, list) else [v]))
+        if stmt.is_insert:
+            _FakeSession.batches.append(names)
+            rows = []
+            for name in names:
+                if name not in _FakeSession.taken:
+                    rows.append(SensorModel(id=_FakeSession.next_id, name=name))
+                    _FakeSession.next_id += 1
+        else:
+            rows = [SensorModel(id=_FakeSession.taken[n], name=n) for n in names if n in _FakeSession.taken]
+
+        class _Result:
+            def scalars(self):
+                return self
+
+            def all(self):
+                return rows
+
+        return _Result()
+
+    async def commit(self):
+        pass
+
+
+def test_provision_batches_new_sensors(monkeypatch):
+    monkeypatch.setattr(settings, "SENSOR_AUTO_PROVISION", True)
+    monkeypatch.setattr(registry_module, "SessionLocal", _FakeSession)
+
+    async def run():
+        registry = SensorRegistry()
+        registry._replace([])
+        ids = await asyncio.gather(registry.provision("a_temp"), registry.provision("b_temp"), registry.provision("a_temp"))
+        return registry, ids
+
+    registry, ids = asyncio.run(run())
+    assert _FakeSession.batches == [["a_temp", "b_temp"]]
+    assert ids[0] == ids[2] and ids[0] != ids[1]
+    assert registry.resolve("b_temp") == ids[1]
+    assert registry.can_provision("c_humidity")
+    assert not registry.can_provision("42")
+
+
+def test_provision_rereads_names_created_concurrently(monkeypatch):
+    monkeypatch.setattr(settings, "SENSOR_AUTO_PROVISION", True)
+    monkeypatch.setattr(registry_module, "SessionLocal", _FakeSession)
+    monkeypatch.setattr(_FakeSession, "taken", {"c_temp": 3})
+    monkeypatch.setattr(_FakeSession, "batches", [])
+
+    async def run():
+        registry = SensorRegistry()
+        registry._replace([])
+        ids = await asyncio.gather(registry.provision("c_temp"), registry.provision("d_temp"))
+        return registry, ids
+
+    registry, ids = asyncio.run(run())
+    assert _FakeSession.batches == [["c_temp", "d_temp"]]
+    assert ids[0] == 3 and ids[1] not in (None, 3)
+    assert registry.resolve("c_temp") == 3
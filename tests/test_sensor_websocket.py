@@ -0,0 +1,100 @@
+import asyncio
+
+from app.modules.sensors.websocket_manager import SensorWebSocketManager
+
+
+class _FakeSocket:
+    def __init__(self, fail: bool = False):
+        self.sent = []
+        self.fail = fail
+
+    async def send_json(self, payload):
+        if self.fail:
+            raise RuntimeError("closed")
+        self.sent.append(payload)
+
+
+def test_broadcast_routes_by_sensor_location_and_metric():
+    manager = SensorWebSocketManager()
+    everyone, by_id, by_location, by_metric = (_FakeSocket() for _ in range(4))
+
+    async def run():
+        await manager.connect(everyone, None)
+        await manager.connect(by_id, 1)
+        manager.subscribe(by_location, locations=["plant-a/"])
+        manager.subscribe(by_metric, metrics=["temp*"])
+        await manager.broadcast_reading(1, {"v": 1}, name="DHT11_humidity", location="plant-b/room")
+        await manager.broadcast_reading(2, {"v": 2}, name="DHT11_temperature", location="plant-a/room")
+
+    asyncio.run(run())
+    assert everyone.sent == [{"v": 1}, {"v": 2}]
+    assert by_id.sent == [{"v": 1}]
+    assert by_location.sent == [{"v": 2}]
+    assert by_metric.sent == [{"v": 2}]
+
+
+def test_disconnect_and_stale_sockets_are_removed():
+    manager = SensorWebSocketManager()
+    alive, stale = _FakeSocket(), _FakeSocket(fail=True)
+
+    async def run():
+        manager.subscribe(alive, sensor_ids=[1, 2])
+        manager.subscribe(stale, sensor_ids=[1], metrics=["*"])
+        await manager.broadcast_reading(1, {"v": 1}, name="x_y")
+        assert not manager.needs_metadata
+        await manager.disconnect(alive)
+
+    asyncio.run(run())
+    assert alive.sent == [{"v": 1}]
+    assert manager._by_sensor == {}
+    assert manager._subs == {}
+
+
+def test_location_prefixes_and_metric_patterns_are_indexed():
+    manager = SensorWebSocketManager()
+    site, line, exact, wildcard = (_FakeSocket() for _ in range(4))
+
+    async def run():
+        manager.subscribe(site, locations=["plant-a/"])
+        manager.subscribe(line, locations=["plant-a/line-1", "plant-b"])
+        manager.subscribe(exact, metrics=["Humidity"])
+        manager.subscribe(wildcard, metrics=["temp*", "pressure"])
+        await manager.broadcast_reading(1, {"v": 1}, name="DHT11_temperature", location="plant-a/line-10")
+        await manager.broadcast_reading(2, {"v": 2}, name="DHT11_humidity", location="plant-b")
+        await manager.broadcast_reading(3, {"v": 3}, name="DHT11_pressure", location="plant")
+        manager.unsubscribe(line, locations=["plant-a/line-1"])
+        await manager.broadcast_reading(4, {"v": 4}, location="plant-a/line-1")
+        for ws in (site, line, exact, wildcard):
+            await manager.disconnect(ws)
+
+    asyncio.run(run())
+    assert site.sent == [{"v": 1}, {"v": 4}]
+    assert line.sent == [{"v": 1}, {"v": 2}]
+    assert exact.sent == [{"v": 2}]
+    assert wildcard.sent == [{"v": 1}, {"v": 3}]
+    assert manager._by_location == {} and manager._location_lengths == {}
+    assert manager._by_metric == {} and manager._by_pattern == {}
+    assert not manager.needs_metadata
+
+
+def test_throttled_stream_coalesces_per_tick():
+    manager = SensorWebSocketManager()
+    ws = _FakeSocket()
+
+    async def run():
+        await manager.connect(ws, None, max_hz=20, agg="minmax")
+        for i, value in enumerate([1.0, 5.0, 3.0]):
+            await manager.broadcast_reading(1, {"sensor_id": 1, "timestamp": f"t{i}", "value": value})
+        await manager.broadcast_reading(2, {"sensor_id": 2, "timestamp": "t9", "value": 7.0})
+        assert ws.sent == []
+        await asyncio.sleep(0.08)
+        await manager.disconnect(ws)
+
+    asyncio.run(run())
+    assert len(ws.sent) == 1
+    frame = ws.sent[0]
+    assert frame["type"] == "readings" and frame["agg"] == "minmax"
+    assert frame["readings"] == [
+        {"sensor_id": 1, "timestamp": "t2", "count": 3, "min": 1.0, "max": 5.0, "value": 3.0},
+        {"sensor_id": 2, "timestamp": "t9", "count": 1, "min": 7.0, "max": 7.0, "value": 7.0},
+    ]